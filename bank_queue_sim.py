@@ -3,9 +3,41 @@
 # Author: K.D.H.P.Kothalawala
 # ==============================
 
+import os
+import io
+import sys
+import csv
+import json
+import math
+import heapq
+import collections
+import itertools
+import argparse
+import hashlib
+import mmap
+import struct
+import contextlib
+import pickle
+import zipfile
 import simpy
 import random
 import statistics
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from erlang_c import mmc_metrics
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed for the vectorized engine and 'numpy' storage
+    np = None
+
+ENGINES = ('simpy', 'numpy', 'kernel')
+# Bump an engine's version whenever a change alters its results, so cached runs are not reused
+ENGINE_VERSIONS = {'simpy': 1, 'numpy': 1, 'kernel': 1}
+STORAGE_MODES = ('list', 'array', 'numpy', 'stream', 'sketch', 'batch', 'mmap')
+STREAMING_STORAGE = ('stream', 'sketch', 'batch')
+VARIATE_BLOCK_SIZE = 4096
 
 # === Function to Get Simulation Parameters ===
 def get_simulation_parameters():
@@ -37,90 +69,2250 @@ def get_simulation_parameters():
     return num_tellers, mean_interarrival, mean_service_time, sim_time, num_runs
 
 
+# === Random Streams ===
+def replication_seed(master_seed, *spawn_key):
+    """Derive an independent 64-bit child seed from a master seed, SeedSequence-style.
+
+    The same (master_seed, spawn_key) always gives the same seed and different
+    keys give unrelated streams, so run k of a study can be replayed on its own
+    with run_single_simulation(..., seed=replication_seed(master_seed, k)).
+    """
+    digest = hashlib.blake2b(repr((master_seed,) + spawn_key).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+class AntitheticRandom(random.Random):
+    """random.Random whose uniforms are mirrored (1 - U), so expovariate() gives -log(U)/lambd.
+
+    Seeded like a plain Random, it yields the antithetic twin of that stream.
+    """
+
+    def random(self):
+        u = super().random()
+        return 1.0 - u if u else 0.0  # keep the [0, 1) range; U = 0 has probability 2**-53
+
+
+class VariateBuffer:
+    """Standard exponential variates drawn in blocks and handed out from a cursor.
+
+    expovariate() matches random.Random.expovariate, so a buffer can stand in
+    for the generators customer/customer_arrivals draw from; take() serves the
+    vectorized engine from the same stream. antithetic=False/True draws by
+    inversion from uniforms U or 1 - U, for the two members of an antithetic
+    pair; the default uses NumPy's faster standard_exponential.
+    """
+
+    def __init__(self, seed, block_size=VARIATE_BLOCK_SIZE, antithetic=None):
+        self.block_size = block_size
+        self.antithetic = antithetic
+        if np is not None:
+            self._rng = np.random.default_rng(seed)
+        else:
+            self._rng = AntitheticRandom(seed) if antithetic else random.Random(seed)
+        self._block = []
+        self._cursor = 0
+
+    def _draw(self, count):
+        if np is not None:
+            if self.antithetic is None:
+                return self._rng.standard_exponential(count)
+            uniforms = self._rng.random(count)
+            if self.antithetic:
+                return -np.log(np.where(uniforms > 0, uniforms, 1.0))
+            return -np.log1p(-uniforms)
+        draw = self._rng.random
+        return array('d', [-math.log(1.0 - draw()) for _ in range(count)])
+
+    def expovariate(self, lambd):
+        if self._cursor == len(self._block):
+            # Refill lazily; tolist() makes the per-call hand-out a plain list index
+            block = self._draw(self.block_size)
+            self._block = block.tolist()
+            self._cursor = 0
+        value = self._block[self._cursor]
+        self._cursor += 1
+        return value / lambd
+
+    def take(self, count):
+        """The next count standard exponentials as one array (ndarray with NumPy, else array('d'))."""
+        buffered = self._block[self._cursor:self._cursor + count]
+        self._cursor += len(buffered)
+        fresh = self._draw(count - len(buffered)) if count > len(buffered) else self._draw(0)
+        if np is not None:
+            return np.concatenate((np.asarray(buffered, dtype=float), fresh))
+        return array('d', buffered) + fresh
+
+
+def _make_streams(seed, variate_block=None, antithetic=None):
+    """Separate arrival and service generators for one replication (buffered if variate_block is set).
+
+    antithetic=True mirrors both streams (see AntitheticRandom); False and None
+    give the plain streams, with False forcing inversion in VariateBuffer so
+    they pair with the mirrored ones.
+    """
+    if variate_block:
+        return (VariateBuffer(replication_seed(seed, 'arrivals'), variate_block, antithetic),
+                VariateBuffer(replication_seed(seed, 'service'), variate_block, antithetic))
+    generator = AntitheticRandom if antithetic else random.Random
+    return generator(replication_seed(seed, 'arrivals')), generator(replication_seed(seed, 'service'))
+
+
+# === Event Tracing ===
+TRACE_RUN, TRACE_EVENT = 1, 2  # run headers/summaries only, or every customer event as well
+TRACE_LEVELS = {'run': TRACE_RUN, 'event': TRACE_EVENT}
+
+
+def format_trace_record(record):
+    """Text form of a trace record (the same lines verbose runs have always printed)."""
+    kind = record[0]
+    if kind == 'arrive':
+        return f"Customer_{record[2]} arrives at {record[1]:.2f}"
+    if kind == 'start':
+        return f"Customer_{record[2]} starts service at {record[1]:.2f} (Waited {record[3]:.2f} mins)"
+    if kind == 'leave':
+        return f"Customer_{record[2]} leaves at {record[1]:.2f}"
+    if kind == 'run_start':
+        return f"\n--- Simulation Run {record[1]} ---"
+    return f"Run {record[1]} - Customers: {record[2]}, Avg Wait: {record[3]:.2f} mins"
+
+
+class NullSink:
+    """Discards every record."""
+
+    def write(self, record):
+        pass
+
+    def flush(self):
+        pass
+
+
+class StreamSink:
+    """Formats records as text and writes them to a stream (default stdout) in batches."""
+
+    def __init__(self, stream=None, batch_size=1000):
+        self.stream = stream  # resolved at flush time so the sink stays picklable
+        self.batch_size = batch_size
+        self._lines = []
+
+    def write(self, record):
+        self._lines.append(format_trace_record(record))
+        if len(self._lines) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            (self.stream or sys.stdout).write("\n".join(self._lines) + "\n")
+            self._lines = []
+
+
+class FileSink(StreamSink):
+    """StreamSink appending to a file that is only opened while flushing.
+
+    Safe to hand to worker processes; each flush is one append of a whole batch.
+    """
+
+    def __init__(self, path, batch_size=10000):
+        super().__init__(None, batch_size)
+        self.path = path
+
+    def flush(self):
+        if self._lines:
+            with open(self.path, 'a') as f:
+                f.write("\n".join(self._lines) + "\n")
+            self._lines = []
+
+
+class RingBufferSink:
+    """Keeps the most recent records, unformatted, in a bounded in-memory buffer."""
+
+    def __init__(self, capacity=10000):
+        self.records = collections.deque(maxlen=capacity)
+
+    def write(self, record):
+        self.records.append(record)
+
+    def flush(self):
+        pass
+
+
+class EventTracer:
+    """Sends structured trace records to a sink.
+
+    Records are tuples: ('arrive' | 'start' | 'leave', time, customer_id, wait)
+    for customer events, ('run_start', run_number) and ('run_end', run_number,
+    customers_served, avg_waiting_time) for runs. level='run' keeps only the
+    run records; sample_every=N traces the events of every N-th customer only.
+    Engines check for a tracer once per customer, so tracing off costs nothing.
+    """
+
+    def __init__(self, sink=None, level='event', sample_every=1):
+        if level not in TRACE_LEVELS:
+            raise ValueError(f"Unknown trace level {level!r}; expected one of {tuple(TRACE_LEVELS)}")
+        self.sink = sink if sink is not None else StreamSink()
+        self.level = TRACE_LEVELS[level]
+        self.sample_every = max(int(sample_every), 1)
+
+    @property
+    def traces_events(self):
+        return self.level >= TRACE_EVENT
+
+    def traces(self, customer_id):
+        """Whether this customer's events are recorded."""
+        return self.level >= TRACE_EVENT and customer_id % self.sample_every == 0
+
+    def run_started(self, run_number):
+        self.sink.write(('run_start', run_number))
+
+    def run_finished(self, run_number, stats):
+        if stats['customers_served']:
+            self.sink.write(('run_end', run_number, stats['customers_served'], stats['avg_waiting_time']))
+        self.sink.flush()
+
+
+# === Binary Event Trace ===
+TRACE_FILE_HEADER = struct.Struct('<4sIIQ4x')  # magic, format version, record size, record count
+TRACE_MAGIC, TRACE_VERSION = b'BQTR', 1
+TRACE_RECORD = struct.Struct('<qiiddd')  # customer_id, run, teller, arrival, start, depart
+
+
+class TellerAssignment:
+    """Mixin for recorders: numbers the tellers in engines that do not track them (simpy)."""
+
+    def _reset_tellers(self, num_tellers):
+        self._free_tellers = list(range(num_tellers - 1, -1, -1))  # same teller order as the kernel
+
+    def acquire_teller(self):
+        return self._free_tellers.pop()
+
+    def release_teller(self, teller):
+        self._free_tellers.append(teller)
+
+
+class BinaryTraceRecorder(TellerAssignment):
+    """Writes one fixed-size binary record per served customer into a memory-mapped file.
+
+    Each record is (customer_id, run, teller, arrival, start, depart), written
+    when service starts, so depart may lie past the horizon. Customers still
+    queueing at the horizon get a record with teller -1 and NaN start and
+    depart when the run ends. A record with customer_id 0 opens every run and
+    holds num_tellers in teller and the horizon in arrival. Put '{run}' in
+    path to get one file per run, which is required when runs go to worker
+    processes.
+    """
+
+    def __init__(self, path, initial_records=1 << 16):
+        self.path = path
+        self.initial_records = initial_records
+        self.run_number = 0
+        self._file = None
+        self._map = None
+        self._current_path = None
+        self._offset = 0
+        self._free_tellers = []
+
+    def __getstate__(self):
+        # Open files and maps stay with the process that created them
+        state = self.__dict__.copy()
+        state.update(_file=None, _map=None, _current_path=None)
+        return state
+
+    def _open(self, path):
+        self.close()
+        self._file = open(path, 'w+b')
+        size = TRACE_FILE_HEADER.size + self.initial_records * TRACE_RECORD.size
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._offset = TRACE_FILE_HEADER.size
+        self._write_header()
+        self._current_path = path
+
+    def _write_header(self):
+        count = (self._offset - TRACE_FILE_HEADER.size) // TRACE_RECORD.size
+        TRACE_FILE_HEADER.pack_into(self._map, 0, TRACE_MAGIC, TRACE_VERSION, TRACE_RECORD.size, count)
+
+    def _reserve(self, size):
+        """Make room for size more bytes, doubling the mapped file as needed."""
+        needed = self._offset + size
+        if needed <= len(self._map):
+            return
+        new_size = len(self._map)
+        while new_size < needed:
+            new_size *= 2
+        self._map.close()
+        self._file.truncate(new_size)
+        self._map = mmap.mmap(self._file.fileno(), new_size)
+
+    def _write(self, customer_id, teller, arrival, start, depart):
+        self._reserve(TRACE_RECORD.size)
+        TRACE_RECORD.pack_into(self._map, self._offset, customer_id, self.run_number, teller, arrival, start, depart)
+        self._offset += TRACE_RECORD.size
+
+    def begin_run(self, run_number, num_tellers, sim_time):
+        path = self.path.format(run=run_number)
+        if path != self._current_path:
+            self._open(path)
+        self.run_number = run_number
+        self._reset_tellers(num_tellers)
+        self._write(0, num_tellers, sim_time, 0.0, 0.0)
+
+    def record(self, customer_id, teller, arrival, start, depart):
+        self._write(customer_id, teller, arrival, start, depart)
+
+    def record_many(self, customer_ids, tellers, arrivals, starts, departs):
+        """Write a batch of records from NumPy arrays in one copy."""
+        batch = np.empty(len(arrivals), dtype=TRACE_DTYPE)
+        batch['customer_id'] = customer_ids
+        batch['run'] = self.run_number
+        batch['teller'] = tellers
+        batch['arrival'] = arrivals
+        batch['start'] = starts
+        batch['depart'] = departs
+        self._reserve(batch.nbytes)
+        self._map[self._offset:self._offset + batch.nbytes] = batch.tobytes()
+        self._offset += batch.nbytes
+
+    def record_waiting(self, customers):
+        """Record the (customer_id, arrival) pairs still queueing at the horizon."""
+        for customer_id, arrival in customers:
+            self._write(customer_id, -1, arrival, math.nan, math.nan)
+
+    def end_run(self):
+        """Publish the run's records (the header count is what readers trust)."""
+        if '{run}' in self.path:
+            self.close()
+        elif self._map is not None:
+            self._write_header()
+            self._map.flush()
+
+    def close(self):
+        """Unmap and trim the file to the records written."""
+        if self._map is None:
+            return
+        self._write_header()
+        self._map.close()
+        self._file.truncate(self._offset)
+        self._file.close()
+        self._file = self._map = self._current_path = None
+
+
+if np is not None:
+    TRACE_DTYPE = np.dtype([('customer_id', '<i8'), ('run', '<i4'), ('teller', '<i4'),
+                            ('arrival', '<f8'), ('start', '<f8'), ('depart', '<f8')])
+
+
+def read_binary_trace(path):
+    """Memory-map a binary trace and return its records as a NumPy structured array (no copy).
+
+    The mapping stays open for as long as the returned array is referenced.
+    """
+    if np is None:
+        raise ImportError("Reading binary traces requires NumPy (pip install numpy)")
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, record_size, count = TRACE_FILE_HEADER.unpack_from(data, 0)
+    if magic != TRACE_MAGIC or version != TRACE_VERSION or record_size != TRACE_RECORD.size:
+        raise ValueError(f"{path} is not a version {TRACE_VERSION} bank queue trace")
+    return np.frombuffer(data, dtype=TRACE_DTYPE, count=count, offset=TRACE_FILE_HEADER.size)
+
+
+# === Columnar Export ===
+COLUMNAR_FORMATS = {'.npz': 'npz', '.parquet': 'parquet', '.arrow': 'arrow'}
+COLUMN_DTYPES = {'seed': 'uint64'}  # 64-bit seeds overflow int64
+
+
+def _columnar_format(path):
+    fmt = COLUMNAR_FORMATS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise ValueError(f"Unknown columnar format for {path}; use one of {', '.join(COLUMNAR_FORMATS)}")
+    return fmt
+
+
+class ColumnarWriter:
+    """Writes one table to NPZ, Parquet or Arrow IPC (by file extension) in chunks of chunk_rows.
+
+    Rows are buffered per column and flushed as a Parquet row group, an
+    Arrow record batch or, for NPZ, one '<column>/<chunk>.npy' member per
+    column, so memory stays bounded however many rows are written.
+    read_columnar() reads any of them back. The columns and their types are
+    fixed by the first chunk.
+    """
+
+    def __init__(self, path, chunk_rows=65536):
+        if np is None:
+            raise ImportError("Columnar export requires NumPy (pip install numpy)")
+        self.path = path
+        self.format = _columnar_format(path)
+        if self.format != 'npz':
+            try:
+                import pyarrow
+            except ImportError:
+                raise ImportError("Parquet and Arrow export require pyarrow (pip install pyarrow); "
+                                  "use a .npz file instead") from None
+        self.chunk_rows = chunk_rows
+        self.columns = None
+        self.rows_written = 0
+        self._buffers = {}
+        self._dtypes = dict(COLUMN_DTYPES)
+        self._buffered = 0
+        self._chunks = 0
+        self._sink = None
+
+    def write_row(self, row):
+        """Add one row (a dict of scalars); usable as an on_result callback."""
+        if self.columns is None:
+            self.columns = list(row)
+            self._buffers = {column: [] for column in self.columns}
+        for column in self.columns:
+            self._buffers[column].append(row.get(column, math.nan))
+        self._buffered += 1
+        if self._buffered >= self.chunk_rows:
+            self.flush()
+
+    def write_columns(self, columns):
+        """Add a batch of rows given as {column: array}."""
+        if self.columns is None:
+            self.columns = list(columns)
+            self._buffers = {column: [] for column in self.columns}
+        for column in self.columns:
+            self._buffers[column].append(np.asarray(columns[column]))
+        self._buffered += len(columns[self.columns[0]])
+        if self._buffered >= self.chunk_rows:
+            self.flush()
+
+    def _column_array(self, column, parts):
+        dtype = self._dtypes.get(column)
+        if parts and isinstance(parts[0], np.ndarray):
+            values = np.concatenate(parts).astype(dtype, copy=False) if dtype else np.concatenate(parts)
+        else:
+            values = np.asarray(parts, dtype=dtype)
+        self._dtypes[column] = values.dtype
+        return values
+
+    def flush(self):
+        if not self._buffered:
+            return
+        arrays = {column: self._column_array(column, self._buffers[column]) for column in self.columns}
+        self._buffers = {column: [] for column in self.columns}
+        self._buffered = 0
+
+        if self.format == 'npz':
+            if self._sink is None:
+                self._sink = zipfile.ZipFile(self.path, 'w', zipfile.ZIP_STORED, allowZip64=True)
+            for column, values in arrays.items():
+                with self._sink.open(f"{column}/{self._chunks:06d}.npy", 'w', force_zip64=True) as member:
+                    np.lib.format.write_array(member, values, allow_pickle=False)
+        else:
+            import pyarrow
+            table = pyarrow.table(arrays)
+            if self._sink is None:
+                if self.format == 'parquet':
+                    import pyarrow.parquet
+                    self._sink = pyarrow.parquet.ParquetWriter(self.path, table.schema)
+                else:
+                    import pyarrow.ipc
+                    self._sink = pyarrow.ipc.new_file(self.path, table.schema)
+            self._sink.write_table(table)
+        self._chunks += 1
+        self.rows_written += len(arrays[self.columns[0]])
+
+    def close(self):
+        self.flush()
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+
+
+def read_columnar(path):
+    """Read a file written by ColumnarWriter back as {column: ndarray}."""
+    if np is None:
+        raise ImportError("Reading columnar exports requires NumPy (pip install numpy)")
+    fmt = _columnar_format(path)
+    if fmt == 'npz':
+        with np.load(path) as data:
+            chunks = {}
+            for name in sorted(data.files):
+                column = name.rsplit('/', 1)[0]
+                chunks.setdefault(column, []).append(data[name])
+        return {column: np.concatenate(parts) for column, parts in chunks.items()}
+
+    import pyarrow
+    if fmt == 'parquet':
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(path)
+    else:
+        import pyarrow.ipc
+        with pyarrow.memory_map(path) as source:
+            table = pyarrow.ipc.open_file(source).read_all()
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+
+def export_runs(all_stats, path, chunk_rows=65536):
+    """Write the scalar summary of every run (see _run_summary) to a columnar file."""
+    writer = ColumnarWriter(path, chunk_rows)
+    try:
+        for stats in all_stats:
+            writer.write_row(_run_summary(stats))
+    finally:
+        writer.close()
+
+
+class ColumnarCustomerRecorder(TellerAssignment):
+    """Recorder that exports one row per served customer to a columnar file.
+
+    Drop-in for BinaryTraceRecorder: it records (run, customer_id, teller,
+    arrival, start, end, wait, service) through a ColumnarWriter, in chunks,
+    and a '{run}' placeholder in path gives one file per run, which is
+    required when runs go to worker processes.
+    """
+
+    def __init__(self, path, chunk_rows=65536):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        _columnar_format(path)
+        self.run_number = 0
+        self._writer = None
+        self._current_path = None
+        self._free_tellers = []
+        self._records = []
+
+    def __getstate__(self):
+        # Open writers stay with the process that created them
+        state = self.__dict__.copy()
+        state.update(_writer=None, _current_path=None, _records=[])
+        return state
+
+    def begin_run(self, run_number, num_tellers, sim_time):
+        path = self.path.format(run=run_number)
+        if path != self._current_path:
+            self.close()
+            self._writer = ColumnarWriter(path, self.chunk_rows)
+            self._current_path = path
+        self.run_number = run_number
+        self._reset_tellers(num_tellers)
+
+    def record(self, customer_id, teller, arrival, start, depart):
+        self._records.append((customer_id, teller, arrival, start, depart))
+        if len(self._records) >= self.chunk_rows:
+            self._flush_records()
+
+    def record_many(self, customer_ids, tellers, arrivals, starts, departs):
+        self._flush_records()
+        self._write(np.asarray(customer_ids), np.asarray(tellers), arrivals, starts, departs)
+
+    def _flush_records(self):
+        if self._records:
+            customer_ids, tellers, arrivals, starts, departs = (np.array(column) for column in zip(*self._records))
+            self._records = []
+            self._write(customer_ids, tellers, arrivals, starts, departs)
+
+    def _write(self, customer_ids, tellers, arrivals, starts, departs):
+        self._writer.write_columns({
+            'run': np.full(len(arrivals), self.run_number, dtype=np.int32),
+            'customer_id': customer_ids.astype(np.int64),
+            'teller': tellers.astype(np.int32),
+            'arrival': arrivals,
+            'start': starts,
+            'end': departs,
+            'wait': starts - arrivals,
+            'service': departs - starts
+        })
+
+    def record_waiting(self, customers):
+        pass  # only served customers are exported
+
+    def end_run(self):
+        self._flush_records()
+        if '{run}' in self.path:
+            self.close()
+
+    def close(self):
+        self._flush_records()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = self._current_path = None
+
+
+def replay_trace(path):
+    """Reconstruct per-run statistics from a binary trace without re-simulating.
+
+    Returns one dict per run with waits, time-average and maximum queue length
+    and per-teller utilization. Customers still queueing at the horizon (NaN
+    start) count towards the queue but not towards the waits.
+    """
+    records = read_binary_trace(path)
+    run_starts = np.flatnonzero(records['customer_id'] == 0)
+    results = []
+    for first, last in zip(run_starts, list(run_starts[1:]) + [len(records)]):
+        header, run = records[first], records[first + 1:last]
+        num_tellers, sim_time = int(header['teller']), float(header['arrival'])
+        served = run[~np.isnan(run['start'])]
+        waits = served['start'] - served['arrival']
+
+        # Queue length changes: +1 at each arrival, -1 when that customer starts service
+        times = np.concatenate((run['arrival'], served['start']))
+        steps = np.concatenate((np.ones(len(run)), -np.ones(len(served))))
+        order = np.lexsort((steps, times))  # at equal times count the start before the arrival
+        queue_lengths = np.cumsum(steps[order])
+        queue_area = float((np.fmin(run['start'], sim_time) - run['arrival']).sum())  # fmin: NaN start -> horizon
+
+        busy = np.minimum(served['depart'], sim_time) - served['start']
+        per_teller = np.bincount(served['teller'], weights=busy, minlength=num_tellers) / sim_time
+        results.append({
+            'run_number': int(header['run']),
+            'num_tellers': num_tellers,
+            'sim_time': sim_time,
+            'customers_served': len(served),
+            'customers_arrived': len(run),
+            'avg_waiting_time': float(waits.mean()) if len(served) else 0,
+            'max_waiting_time': float(waits.max()) if len(served) else 0,
+            'avg_queue_length': queue_area / sim_time,
+            'max_queue_length': int(queue_lengths.max()) if len(run) else 0,
+            'teller_utilization': per_teller.tolist(),
+            'utilization': float(per_teller.mean())
+        })
+    return results
+
+
+# === Time-Weighted Queue Statistics ===
+def _occupancy_summary(queue_area, busy_area, max_queue, duration, num_tellers):
+    """Time averages from the areas under the queue-length and busy-teller curves."""
+    if duration <= 0:
+        return {'avg_queue_length': 0, 'max_queue_length': max_queue, 'avg_in_system': 0, 'utilization': 0}
+    return {
+        'avg_queue_length': queue_area / duration,
+        'max_queue_length': max_queue,
+        'avg_in_system': (queue_area + busy_area) / duration,
+        'utilization': busy_area / (num_tellers * duration)
+    }
+
+
+class QueueMonitor:
+    """Areas under the queue-length and busy-teller curves, updated in O(1) per state change."""
+
+    def __init__(self, start_time=0.0):
+        self.start_time = start_time
+        self.last_time = start_time
+        self.arrivals = 0
+        self.in_queue = 0
+        self.busy = 0
+        self.max_queue = 0
+        self.queue_area = 0.0
+        self.busy_area = 0.0
+
+    def _advance(self, now):
+        elapsed = now - self.last_time
+        self.queue_area += self.in_queue * elapsed
+        self.busy_area += self.busy * elapsed
+        self.last_time = now
+
+    def arrive(self, now, queued=True):
+        """Count an arrival; queued is False when a teller is free and it goes straight to service."""
+        self._advance(now)
+        self.arrivals += 1
+        if queued:
+            self.in_queue += 1
+            if self.in_queue > self.max_queue:
+                self.max_queue = self.in_queue
+
+    def start_service(self, now, queued=True):
+        self._advance(now)
+        if queued:
+            self.in_queue -= 1
+        self.busy += 1
+
+    def depart(self, now):
+        self._advance(now)
+        self.busy -= 1
+
+    def reset(self, now):
+        """Forget everything before now (end of a warm-up period)."""
+        self._advance(now)
+        self.start_time = now
+        self.arrivals = 0
+        self.queue_area = 0.0
+        self.busy_area = 0.0
+        self.max_queue = self.in_queue
+
+    def summary(self, end_time, num_tellers):
+        self._advance(end_time)
+        summary = _occupancy_summary(self.queue_area, self.busy_area, self.max_queue, end_time - self.start_time, num_tellers)
+        summary['customers_arrived'] = self.arrivals
+        return summary
+
+
+# === Warm-Up Detection ===
+def mser5_truncation(samples):
+    """Number of leading observations MSER-5 marks as initialization bias.
+
+    The samples are grouped into batch means of 5 and the truncation point d
+    minimizes the squared standard error of the remaining batch means,
+    sum((Y_i - mean)^2) / (k - d)^2, with d limited to the first half.
+    """
+    k = len(samples) // 5
+    if k < 4:
+        return 0
+    if np is not None:
+        batches = np.asarray(samples[:5 * k], dtype=float).reshape(k, 5).mean(axis=1)
+        remaining = np.arange(k, 0, -1)
+        tail_sum = np.cumsum(batches[::-1])[::-1]
+        tail_sq = np.cumsum((batches * batches)[::-1])[::-1]
+        mser = (tail_sq - tail_sum * tail_sum / remaining) / (remaining * remaining)
+        return 5 * int(np.argmin(mser[:k // 2 + 1]))
+
+    batches = [math.fsum(samples[5 * i:5 * i + 5]) / 5 for i in range(k)]
+    best_d, best = 0, math.inf
+    tail_sum = tail_sq = 0.0
+    scores = [0.0] * k
+    for d in range(k - 1, -1, -1):
+        tail_sum += batches[d]
+        tail_sq += batches[d] * batches[d]
+        remaining = k - d
+        scores[d] = (tail_sq - tail_sum * tail_sum / remaining) / (remaining * remaining)
+    for d in range(k // 2 + 1):
+        if scores[d] < best:
+            best_d, best = d, scores[d]
+    return 5 * best_d
+
+
+def _end_warmup(env, monitor, warmup):
+    """simpy process that restarts the time-weighted statistics at the end of the warm-up."""
+    yield env.timeout(warmup)
+    monitor.reset(env.now)
+
+
 # === Customer Process ===
-def customer(env, name, bank, mean_service_time, waiting_times, service_times, verbose=False):
-    """A customer arrives, waits for a teller, gets served, then leaves."""
+def customer(env, customer_id, bank, mean_service_time, waiting_times, service_times, tracer=None, rng=random, recorder=None,
+             monitor=None, warmup=0.0):
+    """A customer arrives, waits for a teller, gets served, then leaves.
+
+    Customers arriving before warmup are simulated but left out of the samples.
+    """
     arrival_time = env.now
-    if verbose:
-        print(f"{name} arrives at {arrival_time:.2f}")
+    trace = tracer.sink.write if tracer is not None and tracer.traces(customer_id) else None
+    if trace is not None:
+        trace(('arrive', arrival_time, customer_id, None))
+    queued = bank.count >= bank.capacity  # a free teller takes the customer without queueing
+    if monitor is not None:
+        monitor.arrive(arrival_time, queued)
 
     with bank.request() as request:
+        if recorder is not None:
+            request.customer = (customer_id, arrival_time)  # recorded as still waiting if the horizon comes first
         yield request  # Wait for a teller
+        if monitor is not None:
+            monitor.start_service(env.now, queued)
         wait = env.now - arrival_time
-        waiting_times.append(wait)
-        if verbose:
-            print(f"{name} starts service at {env.now:.2f} (Waited {wait:.2f} mins)")
+        counted = arrival_time >= warmup
+        if counted:
+            waiting_times.append(wait)
+        if trace is not None:
+            trace(('start', env.now, customer_id, wait))
 
         # Service process
-        service_time = random.expovariate(1.0 / mean_service_time)
-        service_times.append(service_time)
+        service_time = rng.expovariate(1.0 / mean_service_time)
+        if counted:
+            service_times.append(service_time)
+        if recorder is not None:
+            teller = recorder.acquire_teller()
+            recorder.record(customer_id, teller, arrival_time, env.now, env.now + service_time)
         yield env.timeout(service_time)
-        if verbose:
-            print(f"{name} leaves at {env.now:.2f}")
+        if monitor is not None:
+            monitor.depart(env.now)
+        if recorder is not None:
+            recorder.release_teller(teller)
+        if trace is not None:
+            trace(('leave', env.now, customer_id, None))
 
 
 # === Customer Arrival Process ===
-def customer_arrivals(env, bank, mean_interarrival, mean_service_time, waiting_times, service_times, verbose=False):
+def customer_arrivals(env, bank, mean_interarrival, mean_service_time, waiting_times, service_times, tracer=None,
+                      arrival_rng=random, service_rng=random, recorder=None, monitor=None, warmup=0.0):
     """Generate customers arriving randomly."""
     customer_id = 0
     while True:
-        yield env.timeout(random.expovariate(1.0 / mean_interarrival))
+        yield env.timeout(arrival_rng.expovariate(1.0 / mean_interarrival))
         customer_id += 1
-        env.process(customer(env, f"Customer_{customer_id}", bank, mean_service_time, waiting_times, service_times, verbose))
+        env.process(customer(env, customer_id, bank, mean_service_time, waiting_times, service_times, tracer, service_rng,
+                             recorder, monitor, warmup))
 
 
-# === Run a Single Simulation ===
-def run_single_simulation(num_tellers, mean_interarrival, mean_service_time, sim_time, run_number=1, verbose=False):
-    """Run one simulation and return statistics."""
-    if verbose:
-        print(f"\n--- Simulation Run {run_number} ---")
-    
-    env = simpy.Environment()
-    bank = simpy.Resource(env, capacity=num_tellers)
+# === Streaming Statistics ===
+class QuantileSketch:
+    """Mergeable log-bucket histogram answering quantiles within a fixed relative error."""
 
-    # Data lists
-    waiting_times = []
-    service_times = []
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.buckets = {}
+        self.zero_count = 0  # zero waits are common, keep them out of the log buckets
+        self.count = 0
 
-    env.process(customer_arrivals(env, bank, mean_interarrival, mean_service_time, waiting_times, service_times, verbose))
-    env.run(until=sim_time)
+    def append(self, value):
+        self.count += 1
+        if value <= 0:
+            self.zero_count += 1
+        else:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def extend(self, values):
+        if np is None or not isinstance(values, np.ndarray):
+            for value in values:
+                self.append(value)
+            return
+        positive = values[values > 0]
+        self.count += len(values)
+        self.zero_count += len(values) - len(positive)
+        if len(positive):
+            keys, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64), return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge quantile sketches with different accuracies")
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def quantile(self, q):
+        """Approximate q-quantile (0 <= q <= 1) of everything added so far."""
+        if not self.count:
+            return 0
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                return 2 * self._gamma ** key / (self._gamma + 1)
+        return 2 * self._gamma ** max(self.buckets) / (self._gamma + 1)
+
+
+class RunningStats:
+    """Constant-memory count/mean/variance/min/max (Welford), mergeable across runs.
+
+    Exposes append() like a list so it can stand in for the per-customer sample lists.
+    """
+
+    def __init__(self, quantiles=False, relative_accuracy=0.01):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch(relative_accuracy) if quantiles else None
+
+    def append(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if self.sketch is not None:
+            self.sketch.append(value)
+
+    def extend(self, values):
+        if np is None or not isinstance(values, np.ndarray):
+            for value in values:
+                self.append(value)
+            return
+        if not len(values):
+            return
+        mean = float(values.mean())
+        self._combine(len(values), mean, float(((values - mean) ** 2).sum()), float(values.min()), float(values.max()))
+        if self.sketch is not None:
+            self.sketch.extend(values)
+
+    def merge(self, other):
+        self._combine(other.count, other.mean, other._m2, other.min, other.max)
+        if self.sketch is not None and other.sketch is not None:
+            self.sketch.merge(other.sketch)
+        elif self.sketch is not None and other.count:
+            self.sketch = None  # the merged distribution would be incomplete
+
+    def _combine(self, count, mean, m2, low, high):
+        """Chan et al. pairwise update of the moments."""
+        if not count:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self._m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
+
+    @property
+    def variance(self):
+        return self._m2 / (self.count - 1) if self.count > 1 else 0
+
+    @property
+    def stdev(self):
+        return self.variance ** 0.5
+
+    def quantile(self, q):
+        if self.sketch is None:
+            raise ValueError("Quantiles need RunningStats(quantiles=True)")
+        return self.sketch.quantile(q)
+
+
+def _t_quantile(df, confidence=0.95):
+    """Two-sided Student t critical value.
+
+    Exact closed forms for df 1 and 2. Otherwise the Cornish-Fisher expansion
+    around the normal quantile, which is off in the tails for small df, so
+    below 30 it is refined by Newton steps on the exact t distribution.
+    """
+    if df == 1:
+        return math.tan(math.pi * confidence / 2)
+    if df == 2:
+        return confidence * math.sqrt(2 / (1 - confidence * confidence))
+    z = statistics.NormalDist().inv_cdf((1 + confidence) / 2)
+    z2 = z * z
+    t = z * (1 + (z2 + 1) / (4 * df) + (5 * z2 * z2 + 16 * z2 + 3) / (96 * df ** 2)
+             + (3 * z2 ** 3 + 19 * z2 * z2 + 17 * z2 - 15) / (384 * df ** 3)
+             + (79 * z2 ** 4 + 776 * z2 ** 3 + 1482 * z2 * z2 - 1920 * z2 - 945) / (92160 * df ** 4))
+    if df >= 30 or df != int(df):
+        return t
+    df = int(df)
+    log_norm = math.lgamma((df + 1) / 2) - math.lgamma(df / 2) - 0.5 * math.log(df * math.pi)
+    for _ in range(50):
+        density = 2 * math.exp(log_norm - (df + 1) / 2 * math.log1p(t * t / df))  # of |T|
+        step = (_t_central_probability(t, df) - confidence) / density
+        t -= step
+        if abs(step) < 1e-12 * t:
+            break
+    return t
+
+
+def _t_central_probability(t, df):
+    """P(|T| <= t) for integer df, by the finite series of Abramowitz & Stegun 26.7.3-4."""
+    theta = math.atan(t / math.sqrt(df))
+    cos2 = math.cos(theta) ** 2
+    if df % 2:
+        term = total = math.cos(theta)
+        for k in range(3, df, 2):
+            term *= cos2 * (k - 1) / k
+            total += term
+        return 2 / math.pi * (theta + (math.sin(theta) * total if df > 1 else 0.0))
+    term = total = 1.0
+    for k in range(2, df, 2):
+        term *= cos2 * (k - 1) / k
+        total += term
+    return math.sin(theta) * total
+
+
+def _lag1_autocorrelation(values):
+    mean = math.fsum(values) / len(values)
+    deviations = [value - mean for value in values]
+    denominator = math.fsum(d * d for d in deviations)
+    if denominator == 0:
+        return 0.0
+    return math.fsum(a * b for a, b in zip(deviations, deviations[1:])) / denominator
+
+
+class BatchMeans(RunningStats):
+    """RunningStats that also keeps batch means of the series for one long run.
+
+    Observations are averaged into at most max_batches batches; when they are
+    all full, adjacent batches are merged and the batch size doubles, so the
+    memory stays constant however long the run is.
+    """
+
+    def __init__(self, max_batches=64, quantiles=False, relative_accuracy=0.01):
+        if max_batches < 4 or max_batches % 2:
+            raise ValueError("max_batches must be an even number of at least 4")
+        super().__init__(quantiles, relative_accuracy)
+        self.max_batches = max_batches
+        self.batch_size = 1
+        self.batch_means = []
+        self._partial_sum = 0.0
+        self._partial_count = 0
+
+    def append(self, value):
+        super().append(value)
+        self._add_to_batch(value)
+
+    def extend(self, values):
+        if np is None or not isinstance(values, np.ndarray):
+            for value in values:
+                self.append(value)
+            return
+        super().extend(values)
+        for value in values.tolist():
+            self._add_to_batch(value)
+
+    def merge(self, other):
+        raise TypeError("Batch means describe one run and cannot be merged; merge into a RunningStats instead")
+
+    def _add_to_batch(self, value):
+        self._partial_sum += value
+        self._partial_count += 1
+        if self._partial_count == self.batch_size:
+            self.batch_means.append(self._partial_sum / self.batch_size)
+            self._partial_sum, self._partial_count = 0.0, 0
+            if len(self.batch_means) == self.max_batches:
+                self.batch_means = _merge_adjacent(self.batch_means)
+                self.batch_size *= 2
+
+    def interval(self, confidence=0.95, max_lag1=0.2, min_batches=10):
+        """Batch-means confidence interval for the steady-state mean.
+
+        Batches are merged further while their lag-1 autocorrelation exceeds
+        max_lag1 and at least 2 * min_batches batches remain. The returned dict
+        holds mean, half_width, batches, batch_size, lag1_autocorrelation and
+        uncorrelated (whether the final batches passed the check).
+        """
+        means, batch_size = list(self.batch_means), self.batch_size
+        if len(means) < 2:
+            return {'mean': self.mean, 'half_width': math.inf, 'batches': len(means), 'batch_size': batch_size,
+                    'lag1_autocorrelation': 0.0, 'uncorrelated': False}
+        lag1 = _lag1_autocorrelation(means)
+        while lag1 > max_lag1 and len(means) >= 2 * min_batches:
+            means, batch_size = _merge_adjacent(means), 2 * batch_size
+            lag1 = _lag1_autocorrelation(means)
+
+        # The partial batch at the end is left out so every batch has the same size
+        mean = math.fsum(means) / len(means)
+        half_width = _t_quantile(len(means) - 1, confidence) * statistics.stdev(means) / len(means) ** 0.5
+        return {'mean': mean, 'half_width': half_width, 'batches': len(means), 'batch_size': batch_size,
+                'lag1_autocorrelation': lag1, 'uncorrelated': lag1 <= max_lag1}
+
+
+def _merge_adjacent(means):
+    """Average neighbouring batch means pairwise (an odd last batch is dropped)."""
+    return [(a + b) / 2 for a, b in zip(means[0::2], means[1::2])]
+
+
+# === Compact Sample Storage ===
+class SampleBuffer:
+    """Growable float64 buffer backed by a preallocated NumPy array."""
+
+    def __init__(self, capacity=1024):
+        self._data = np.empty(max(int(capacity), 16))
+        self._size = 0
+
+    def append(self, value):
+        if self._size == len(self._data):
+            grown = np.empty(2 * len(self._data))
+            grown[:self._size] = self._data
+            self._data = grown
+        self._data[self._size] = value
+        self._size += 1
+
+    def __len__(self):
+        return self._size
+
+    def to_array(self):
+        """The collected samples as an ndarray, trimmed of unused capacity."""
+        if self._size == len(self._data):
+            return self._data
+        return self._data[:self._size].copy()
+
+
+# === Memory-Mapped Sample Store ===
+MAPPED_CHUNK_SIZE = 1 << 20  # values per streaming step (8 MiB of float64)
+
+
+class MappedSampleBuffer:
+    """Appends float64 samples to a raw little-endian file segment, staged in blocks.
+
+    The file has no header (its size / 8 is the count), so it can be memory-mapped
+    as an ndarray with no copy once closed; see _map_samples().
+    """
+
+    def __init__(self, path, block_size=1 << 16):
+        self.path = path
+        self.block_size = block_size
+        self._file = open(path, 'wb')
+        self._staged = array('d')
+        self._count = 0
+
+    def append(self, value):
+        self._staged.append(value)
+        if len(self._staged) >= self.block_size:
+            self._flush()
+
+    def extend(self, values):
+        self._flush()
+        values = np.asarray(values, dtype='<f8')
+        self._file.write(values.tobytes())
+        self._count += len(values)
+
+    def _flush(self):
+        if self._staged:
+            if sys.byteorder != 'little':
+                self._staged.byteswap()
+            self._staged.tofile(self._file)
+            self._count += len(self._staged)
+            self._staged = array('d')
+
+    def __len__(self):
+        return self._count + len(self._staged)
+
+    def close(self):
+        if self._file is not None:
+            self._flush()
+            self._file.close()
+            self._file = None
+
+
+def _map_samples(path):
+    """Read-only ndarray view of a sample segment, backed by the page cache (no copy)."""
+    if not os.path.getsize(path):
+        return np.empty(0)
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return np.frombuffer(data, dtype='<f8')
+
+
+def _iter_mapped_chunks(paths, chunk_size=MAPPED_CHUNK_SIZE):
+    """Yield consecutive chunk views over the segments in paths, in order."""
+    for path in paths:
+        samples = _map_samples(path)
+        for start in range(0, len(samples), chunk_size):
+            yield samples[start:start + chunk_size]
+
+
+class MappedResultStore:
+    """Directory of per-run waiting and service time segments for studies too large for memory.
+
+    With storage='mmap', run k writes run<k>_waiting.f64 and run<k>_service.f64
+    here, so worker processes never share a file, and its stats only refer to
+    the segments. Aggregates are computed by streaming over the memory-mapped
+    segments chunk by chunk.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def segment(self, run_number, metric):
+        return os.path.join(self.directory, f"run{run_number:06d}_{metric}.f64")
+
+    def sinks(self, run_number):
+        """Fresh (waiting, service) buffers for one run."""
+        return (MappedSampleBuffer(self.segment(run_number, 'waiting')),
+                MappedSampleBuffer(self.segment(run_number, 'service')))
+
+    def aggregate(self, runs, metric='waiting', bins=50, chunk_size=MAPPED_CHUNK_SIZE):
+        """Streaming count, mean, stdev, min, max, P50/P90/P95/P99 and a histogram of one metric.
+
+        runs are the run numbers to include, e.g. [stats['run_number'] for
+        stats in all_stats]; the directory may hold segments of other studies.
+        Two passes: moments and quantile sketch first, then the histogram over
+        [min, max] with fixed bin edges.
+        """
+        paths = [self.segment(run, metric) for run in runs]
+        summary = RunningStats(quantiles=True)
+        for chunk in _iter_mapped_chunks(paths, chunk_size):
+            summary.extend(chunk)
+        if not summary.count:
+            return {'count': 0}
+
+        edges = np.linspace(summary.min, summary.max, bins + 1)
+        counts = np.zeros(bins, dtype=np.int64)
+        for chunk in _iter_mapped_chunks(paths, chunk_size):
+            counts += np.histogram(chunk, bins=edges)[0]
+        result = {'count': summary.count, 'mean': summary.mean, 'stdev': summary.stdev, 'min': summary.min,
+                  'max': summary.max}
+        for q in (50, 90, 95, 99):
+            result[f'p{q}'] = summary.quantile(q / 100)
+        result['histogram'] = {'edges': edges.tolist(), 'counts': counts.tolist()}
+        return result
+
+
+def _make_sample_sink(storage, expected_count=0):
+    """Container the customer process appends waiting/service times to."""
+    if storage == 'list':
+        return []
+    if storage == 'array':
+        return array('d')
+    if storage == 'numpy':
+        # Preallocate a little above the expected count so growth is rare
+        return SampleBuffer(expected_count * 1.1 + 64)
+    if storage == 'batch':
+        return BatchMeans()
+    return RunningStats(quantiles=(storage == 'sketch'))
+
+
+def _convert_samples(values, storage):
+    """Convert a float64 ndarray from the vectorized engine to the requested storage."""
+    if storage == 'numpy':
+        return values
+    if storage == 'array':
+        samples = array('d')
+        samples.frombytes(values.tobytes())
+        return samples
+    return values.tolist()
+
+
+def _concatenate_samples(chunks):
+    """Join per-run sample containers, without per-element Python work for arrays."""
+    if np is not None and any(isinstance(chunk, np.ndarray) for chunk in chunks):
+        return np.concatenate([np.asarray(chunk, dtype=float) for chunk in chunks])
+    if chunks and all(isinstance(chunk, array) for chunk in chunks):
+        joined = array('d')
+        for chunk in chunks:
+            joined.extend(chunk)  # same typecode, so this is a buffer copy
+        return joined
+    joined = []
+    for chunk in chunks:
+        joined.extend(chunk)
+    return joined
+
+
+def _sample_mean(samples):
+    if not len(samples):
+        return 0
+    if np is not None and isinstance(samples, np.ndarray):
+        return float(samples.mean())
+    # fsum is correctly rounded like statistics.mean, without its per-element Fraction work
+    return math.fsum(samples) / len(samples)
+
+
+def _sample_max(samples):
+    if not len(samples):
+        return 0
+    if np is not None and isinstance(samples, np.ndarray):
+        return float(samples.max())
+    return max(samples)
+
+
+def _summarize_run(run_number, waiting_times, service_times, storage='list'):
+    """Build the per-run stats dict from whatever container collected the samples."""
+    if isinstance(waiting_times, MappedSampleBuffer):
+        waiting_times.close()
+        service_times.close()
+        waits, services = _map_samples(waiting_times.path), _map_samples(service_times.path)
+        return {
+            'run_number': run_number,
+            'customers_served': len(waits),
+            'avg_waiting_time': _sample_mean(waits),
+            'max_waiting_time': _sample_max(waits),
+            'avg_service_time': _sample_mean(services),
+            'waiting_segment': waiting_times.path,
+            'service_segment': service_times.path
+        }
+
+    if isinstance(waiting_times, RunningStats):
+        served = waiting_times.count
+        return {
+            'run_number': run_number,
+            'customers_served': served,
+            'avg_waiting_time': waiting_times.mean if served else 0,
+            'max_waiting_time': waiting_times.max if served else 0,
+            'avg_service_time': service_times.mean if service_times.count else 0,
+            'waiting_stats': waiting_times,
+            'service_stats': service_times
+        }
+
+    if isinstance(waiting_times, SampleBuffer):
+        waiting_times, service_times = waiting_times.to_array(), service_times.to_array()
 
-    # Calculate statistics
     stats = {
         'run_number': run_number,
         'customers_served': len(waiting_times),
-        'avg_waiting_time': statistics.mean(waiting_times) if waiting_times else 0,
-        'max_waiting_time': max(waiting_times) if waiting_times else 0,
-        'avg_service_time': statistics.mean(service_times) if service_times else 0,
+        'avg_waiting_time': _sample_mean(waiting_times),
+        'max_waiting_time': _sample_max(waiting_times),
+        'avg_service_time': _sample_mean(service_times),
         'waiting_times': waiting_times,
         'service_times': service_times
     }
-    
-    if verbose and waiting_times:
-        print(f"Run {run_number} - Customers: {len(waiting_times)}, Avg Wait: {stats['avg_waiting_time']:.2f} mins")
+    if np is not None and isinstance(waiting_times, np.ndarray):
+        stats['waiting_times'] = _convert_samples(waiting_times, storage)
+        stats['service_times'] = _convert_samples(service_times, storage)
+    return stats
+
+
+def _run_summary(stats):
+    """Scalar fields of a run's stats dict (drops raw samples and accumulators)."""
+    return {key: value for key, value in stats.items() if isinstance(value, (int, float))}
+
+
+# === Vectorized FCFS Engine ===
+def _draw_arrival_times(source, mean_interarrival, sim_time):
+    """Draw arrival times in bulk from a VariateBuffer until the simulation horizon is passed."""
+    expected = sim_time / mean_interarrival
+    block = int(expected + 4 * expected ** 0.5) + 16
+    chunks = []
+    last = 0.0
+    while last < sim_time:
+        chunk = last + np.cumsum(mean_interarrival * source.take(block))
+        chunks.append(chunk)
+        last = chunk[-1]
+    arrivals = np.concatenate(chunks)
+    return arrivals[:np.searchsorted(arrivals, sim_time)]
+
+
+def _fcfs_start_times(arrivals, service_times, num_tellers, sim_time, tellers=None):
+    """Service start times for a FCFS queue where each customer takes the earliest free teller.
+
+    If a tellers array is given it is filled with the teller each customer gets.
+    """
+    if num_tellers == 1:
+        # Lindley recursion in closed form: start_n = S_n + max_{j<=n}(a_j - S_j)
+        offered = np.concatenate(([0.0], np.cumsum(service_times[:-1])))
+        if tellers is not None:
+            tellers[:] = 0
+        return offered + np.maximum.accumulate(arrivals - offered)
+
+    starts = np.empty(len(arrivals))
+    service = service_times.tolist()
+    if tellers is not None:
+        free_at = [(0.0, teller) for teller in range(num_tellers)]  # min-heap of (release time, teller)
+        for i, arrival in enumerate(arrivals.tolist()):
+            earliest, teller = free_at[0]
+            start = arrival if arrival > earliest else earliest
+            starts[i] = start
+            tellers[i] = teller
+            if start >= sim_time:
+                starts[i:] = start
+                break
+            heapq.heapreplace(free_at, (start + service[i], teller))
+        return starts
+
+    free_at = [0.0] * num_tellers  # min-heap of teller release times
+    for i, arrival in enumerate(arrivals.tolist()):
+        earliest = free_at[0]
+        start = arrival if arrival > earliest else earliest
+        if start >= sim_time:
+            # Start times never decrease, so nobody after this is served either
+            starts[i:] = start
+            break
+        starts[i] = start
+        heapq.heapreplace(free_at, start + service[i])
+    return starts
+
+
+def _run_numpy_engine(num_tellers, mean_interarrival, mean_service_time, sim_time, seed, recorder=None, warmup=0.0,
+                      antithetic=None):
+    """Simulate an M/M/c bank with pre-drawn variates.
+
+    Returns (waiting_times, service_times, occupancy) where the first two are
+    arrays of customers arriving after warmup and occupancy holds the
+    time-weighted queue statistics and the arrival count over
+    [warmup, sim_time]. Uses the same
+    arrival/service streams as the simpy path with variate_block set.
+    """
+    arrival_source, service_source = _make_streams(seed, VARIATE_BLOCK_SIZE, antithetic)
+    arrivals = _draw_arrival_times(arrival_source, mean_interarrival, sim_time)
+    service_times = mean_service_time * service_source.take(len(arrivals))
+    if not len(arrivals):
+        occupancy = _occupancy_summary(0.0, 0.0, 0, sim_time - warmup, num_tellers)
+        occupancy['customers_arrived'] = 0
+        return arrivals, service_times, occupancy
+
+    tellers = np.zeros(len(arrivals), dtype=np.int32) if recorder is not None else None
+    starts = _fcfs_start_times(arrivals, service_times, num_tellers, sim_time, tellers)
+    served = np.searchsorted(starts, sim_time)  # only customers who reached a teller count
+    if recorder is not None:
+        recorder.record_many(np.arange(1, served + 1), tellers[:served], arrivals[:served], starts[:served],
+                             starts[:served] + service_times[:served])
+        recorder.record_waiting(zip(range(served + 1, len(arrivals) + 1), arrivals[served:].tolist()))
+
+    # Areas under the queue-length and busy-teller curves over [warmup, sim_time]
+    departs = starts[:served] + service_times[:served]
+    queue_area = float(np.clip(np.minimum(starts, sim_time) - np.maximum(arrivals, warmup), 0, None).sum())
+    busy_area = float(np.clip(np.minimum(departs, sim_time) - np.maximum(starts[:served], warmup), 0, None).sum())
+    steps = np.concatenate((np.ones(len(arrivals)), -np.ones(served)))
+    times = np.concatenate((arrivals, starts[:served]))
+    order = np.lexsort((steps, times))  # at equal times count the start before the arrival
+    levels = np.cumsum(steps[order])
+    after = np.searchsorted(times[order], warmup)
+    max_queue = int(levels[max(after - 1, 0):].max())
+    occupancy = _occupancy_summary(queue_area, busy_area, max_queue, sim_time - warmup, num_tellers)
+    occupancy['customers_arrived'] = len(arrivals) - int(np.searchsorted(arrivals, warmup))
+
+    waits = starts[:served] - arrivals[:served]
+    if warmup > 0:
+        counted = arrivals[:served] >= warmup
+        return waits[counted], service_times[:served][counted], occupancy
+    return waits, service_times[:served], occupancy
+
+
+# === Event-List Kernel ===
+ARRIVAL, DEPARTURE, WARMUP_END = 0, 1, 2
+
+
+def _run_event_kernel(num_tellers, mean_interarrival, mean_service_time, sim_time, waiting_times, service_times,
+                      arrival_rng, service_rng, tracer=None, recorder=None, warmup=0.0):
+    """Purpose-built discrete-event loop for the bank, equivalent to the simpy model.
+
+    The event list is a binary heap of (time, kind, id) tuples, where id is the
+    customer for arrivals and the teller for departures; idle tellers sit on a
+    free-list and waiting customers in a FIFO deque. Returns the time-weighted
+    queue statistics and the arrival count; a WARMUP_END event restarts them
+    at warmup.
+    """
+    arrival_rate = 1.0 / mean_interarrival
+    service_rate = 1.0 / mean_service_time
+    next_interarrival = arrival_rng.expovariate
+    next_service = service_rng.expovariate
+    record_wait = waiting_times.append
+    record_service = service_times.append
+    heappush, heappop = heapq.heappush, heapq.heappop
+
+    events = [(next_interarrival(arrival_rate), ARRIVAL, 1)]
+    if warmup > 0:
+        events.append((warmup, WARMUP_END, 0))
+        heapq.heapify(events)
+    free_tellers = list(range(num_tellers - 1, -1, -1))  # pop() hands out teller 0 first
+    queue = collections.deque()
+    serving = [None] * num_tellers  # only kept up to date while tracing
+    trace = tracer.sink.write if tracer is not None and tracer.traces_events else None
+    sample_every = tracer.sample_every if trace is not None else 1
+    last_change = queue_area = busy_area = 0.0
+    max_queue = arrivals = 0
+    period_start = 0.0
+
+    while events:
+        now, kind, ident = heappop(events)
+        if now >= sim_time:
+            break
+
+        elapsed = now - last_change
+        queue_area += len(queue) * elapsed
+        busy_area += (num_tellers - len(free_tellers)) * elapsed
+        last_change = now
+
+        if kind == WARMUP_END:
+            period_start, queue_area, busy_area, max_queue, arrivals = now, 0.0, 0.0, len(queue), 0
+            continue
+
+        if kind == ARRIVAL:
+            arrivals += 1
+            heappush(events, (now + next_interarrival(arrival_rate), ARRIVAL, ident + 1))
+            if trace is not None and ident % sample_every == 0:
+                trace(('arrive', now, ident, None))
+            if not free_tellers:
+                queue.append((ident, now))
+                if len(queue) > max_queue:
+                    max_queue = len(queue)
+                continue
+            teller, arrived = free_tellers.pop(), now
+        else:
+            if trace is not None and serving[ident] % sample_every == 0:
+                trace(('leave', now, serving[ident], None))
+            if not queue:
+                free_tellers.append(ident)
+                continue
+            teller = ident
+            ident, arrived = queue.popleft()
+
+        # Customer ident starts service with teller at time now
+        wait = now - arrived
+        service = next_service(service_rate)
+        if arrived >= warmup:
+            record_wait(wait)
+            record_service(service)
+        heappush(events, (now + service, DEPARTURE, teller))
+        if recorder is not None:
+            recorder.record(ident, teller, arrived, now, now + service)
+        if trace is not None:
+            serving[teller] = ident
+            if ident % sample_every == 0:
+                trace(('start', now, ident, wait))
+
+    elapsed = sim_time - last_change
+    queue_area += len(queue) * elapsed
+    busy_area += (num_tellers - len(free_tellers)) * elapsed
+    if recorder is not None:
+        recorder.record_waiting(queue)
+    occupancy = _occupancy_summary(queue_area, busy_area, max_queue, sim_time - period_start, num_tellers)
+    occupancy['customers_arrived'] = arrivals
+    return occupancy
+
+
+# === Run a Single Simulation ===
+def run_single_simulation(num_tellers, mean_interarrival, mean_service_time, sim_time, run_number=1, verbose=False, seed=None, engine='simpy', storage='list',
+                          variate_block=None, tracer=None, recorder=None, warmup=None, antithetic=None, store=None):
+    """Run one simulation and return statistics.
+
+    Arrivals and services come from their own generators seeded from seed
+    (drawn from the global random module when None); the seed used is
+    reported in the stats so the run can be replayed. variate_block=N makes
+    the simpy path draw its variates in blocks of N (see VariateBuffer).
+    engine='numpy' uses the vectorized FCFS engine; it falls back to simpy when
+    customer events are traced, since it has no per-event timeline.
+    engine='kernel' runs the same model on a lightweight event-list loop.
+    storage='array' or 'numpy' keeps raw samples in compact float64 buffers,
+    'stream' keeps RunningStats accumulators ('waiting_stats' and
+    'service_stats') instead of raw samples, 'sketch' adds quantiles and
+    'batch' also keeps the batch means of the waiting times (BatchMeans).
+    storage='mmap' appends the samples to this run's segments in store (a
+    MappedResultStore) and reports their paths as 'waiting_segment' and
+    'service_segment' instead of holding them in memory.
+    Every engine also reports time-weighted avg_queue_length (L_q),
+    max_queue_length, avg_in_system (L) and teller utilization.
+    verbose=True prints the event trace to stdout; pass an EventTracer for
+    other sinks, levels or sampling. recorder (a BinaryTraceRecorder) keeps
+    a binary per-customer trace for replay_trace().
+    warmup (minutes) leaves customers arriving before it out of the samples
+    and starts the time-weighted statistics there. warmup='mser5' instead
+    deletes the initial transient that MSER-5 finds in the waiting times
+    (reported as warmup_deleted); it needs the raw samples for the run, so
+    streaming storage only starts after the truncation.
+    antithetic=False/True makes this run the plain or mirrored member of an
+    antithetic pair (same seed, uniforms U and 1 - U); it is reported in the
+    stats as 'antithetic'.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}; expected one of {ENGINES}")
+    if storage not in STORAGE_MODES:
+        raise ValueError(f"Unknown storage {storage!r}; expected one of {STORAGE_MODES}")
+    if np is None and (engine == 'numpy' or storage in ('numpy', 'mmap')):
+        raise ImportError("engine='numpy' and storage='numpy'/'mmap' require NumPy (pip install numpy)")
+    if (storage == 'mmap') != (store is not None):
+        raise ValueError("storage='mmap' needs a MappedResultStore (store=...), and a store needs storage='mmap'")
+    auto_warmup = warmup == 'mser5'
+    warmup_time = 0.0 if auto_warmup or warmup is None else float(warmup)
+    if not 0 <= warmup_time < sim_time:
+        raise ValueError("warmup must be 'mser5' or a time between 0 and sim_time")
+    if seed is None:
+        seed = random.randrange(2**64)
+    if verbose and tracer is None:
+        tracer = EventTracer(StreamSink())
+
+    if tracer is not None:
+        tracer.run_started(run_number)
+    if recorder is not None:
+        recorder.begin_run(run_number, num_tellers, sim_time)
+
+    if engine == 'numpy' and (tracer is None or not tracer.traces_events):
+        waiting_times, service_times, occupancy = _run_numpy_engine(num_tellers, mean_interarrival, mean_service_time,
+                                                                    sim_time, seed, recorder, warmup_time, antithetic)
+    else:
+        # Data sinks (lists, compact buffers or streaming accumulators)
+        sample_storage = storage
+        if auto_warmup and (storage in STREAMING_STORAGE or storage == 'mmap'):
+            sample_storage = 'numpy' if np is not None else 'array'
+        expected_customers = sim_time / mean_interarrival
+        if sample_storage == 'mmap':
+            waiting_times, service_times = store.sinks(run_number)
+        else:
+            waiting_times = _make_sample_sink(sample_storage, expected_customers)
+            service_times = _make_sample_sink(sample_storage, expected_customers)
+
+        if engine == 'numpy':
+            # Traced numpy runs go through simpy on the numpy engine's own streams
+            variate_block = variate_block or VARIATE_BLOCK_SIZE
+        arrival_rng, service_rng = _make_streams(seed, variate_block, antithetic)
+        if engine == 'kernel':
+            occupancy = _run_event_kernel(num_tellers, mean_interarrival, mean_service_time, sim_time,
+                                          waiting_times, service_times, arrival_rng, service_rng, tracer, recorder,
+                                          warmup_time)
+        else:
+            env = simpy.Environment()
+            bank = simpy.Resource(env, capacity=num_tellers)
+            monitor = QueueMonitor()
+            env.process(customer_arrivals(env, bank, mean_interarrival, mean_service_time, waiting_times, service_times, tracer,
+                                          arrival_rng, service_rng, recorder, monitor, warmup_time))
+            if warmup_time > 0:
+                env.process(_end_warmup(env, monitor, warmup_time))
+            env.run(until=sim_time)
+            occupancy = monitor.summary(sim_time, num_tellers)
+            if recorder is not None:
+                recorder.record_waiting([request.customer for request in bank.queue])
+
+    # Warm-up deletion and conversion to the requested storage
+    if isinstance(waiting_times, SampleBuffer):
+        waiting_times, service_times = waiting_times.to_array(), service_times.to_array()
+    if auto_warmup:
+        deleted = mser5_truncation(waiting_times)
+        waiting_times, service_times = waiting_times[deleted:], service_times[deleted:]
+    if storage in STREAMING_STORAGE and not isinstance(waiting_times, RunningStats):
+        waiting_stats, service_stats = _make_sample_sink(storage), _make_sample_sink(storage)
+        waiting_stats.extend(waiting_times)
+        service_stats.extend(service_times)
+        waiting_times, service_times = waiting_stats, service_stats
+    if storage == 'mmap' and not isinstance(waiting_times, MappedSampleBuffer):
+        waiting_segment, service_segment = store.sinks(run_number)
+        waiting_segment.extend(waiting_times)
+        service_segment.extend(service_times)
+        waiting_times, service_times = waiting_segment, service_segment
+
+    # Calculate statistics
+    stats = _summarize_run(run_number, waiting_times, service_times, storage)
+    stats.update(occupancy)
+    if auto_warmup:
+        stats['warmup_deleted'] = deleted
+    stats['seed'] = seed
+    if antithetic is not None:
+        stats['antithetic'] = int(antithetic)
+    if tracer is not None:
+        tracer.run_finished(run_number, stats)
+    if recorder is not None:
+        recorder.end_run()
     
     return stats
 
 
+# === Result Cache ===
+CACHE_KEY_FIELDS = ('num_tellers', 'mean_interarrival', 'mean_service_time', 'sim_time', 'run_number', 'seed', 'engine',
+                    'storage', 'variate_block', 'warmup', 'antithetic')
+
+
+class ResultCache:
+    """On-disk, content-addressed cache of replication stats with an LRU size bound.
+
+    Each replication is stored under the SHA-256 of its parameters, seed and
+    engine version (ENGINE_VERSIONS), so a study that overlaps an earlier one
+    only simulates the runs it has not seen. Reads refresh a file's mtime and
+    the least recently used files are evicted once the directory grows past
+    max_bytes. Entries are pickles; unreadable ones count as misses.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith('.pkl'))
+        self.hits = self.misses = 0
+        if self._size > max_bytes:
+            self._evict()
+
+    def _path(self, job):
+        fields = {key: job.get(key) for key in CACHE_KEY_FIELDS}
+        # Same key for 480 and 480.0, whichever way the caller spelled it
+        for key in ('mean_interarrival', 'mean_service_time', 'sim_time'):
+            fields[key] = float(fields[key])
+        for key in ('num_tellers', 'run_number'):
+            fields[key] = int(fields[key])
+        if fields['warmup'] not in (None, 'mser5'):
+            fields['warmup'] = float(fields['warmup'])
+        fields['engine_version'] = ENGINE_VERSIONS[job['engine']]
+        digest = hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+        return os.path.join(self.directory, digest + '.pkl')
+
+    def get(self, job):
+        """Cached stats for a replication job, or None."""
+        path = self._path(job)
+        try:
+            with open(path, 'rb') as f:
+                stats = pickle.load(f)
+            os.utime(path)
+        except Exception:  # missing, truncated or written by an incompatible version
+            self.misses += 1
+            return None
+        self.hits += 1
+        return stats
+
+    def put(self, job, stats):
+        path = self._path(job)
+        partial = f"{path}.{os.getpid()}.tmp"
+        with open(partial, 'wb') as f:
+            pickle.dump(stats, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._size += os.path.getsize(partial)
+        try:
+            self._size -= os.path.getsize(path)  # replacing an entry
+        except OSError:
+            pass
+        os.replace(partial, path)  # atomic, so readers never see half a file
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        """Delete least recently used entries until the cache is back under 90% of max_bytes."""
+        entries = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                         for entry in os.scandir(self.directory) if entry.name.endswith('.pkl'))
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+
+# === Replication Jobs ===
+def _run_replication(job):
+    """Run one replication from a dict of keyword arguments (module-level so worker processes can unpickle it)."""
+    return run_single_simulation(**job)
+
+
 # === Run Multiple Simulations ===
-def run_multiple_simulations(num_tellers, mean_interarrival, mean_service_time, sim_time, num_runs):
-    """Run multiple simulations and return aggregated results."""
-    print(f"\n=== Running {num_runs} Simulations ===")
-    
-    all_stats = []
-    
-    for run in range(1, num_runs + 1):
-        # Use different random seed for each run but show first run details
-        verbose = (run == 1)  # Show details only for first run
-        stats = run_single_simulation(num_tellers, mean_interarrival, mean_service_time, sim_time, run, verbose)
-        all_stats.append(stats)
+def run_multiple_simulations(num_tellers, mean_interarrival, mean_service_time, sim_time, num_runs, workers=1, seed=None, engine='simpy', storage='list', verbose=True,
+                             variate_block=None, first_run=1, executor=None, tracer=None, recorder=None, warmup=None,
+                             antithetic=False, cache=None, store=None):
+    """Run multiple simulations and return aggregated results.
+
+    With workers > 1 the runs are spread over a process pool (workers=None uses
+    every CPU core), or over executor when one is given. Run k is seeded with
+    replication_seed(seed, k), so serial and parallel studies give identical
+    results; results come back in run order. first_run numbers the runs from
+    a later point so a study can be continued with more replications.
+    verbose=False suppresses all printing, including the first run's event
+    log. tracer (an EventTracer) traces every run; give it a FileSink when
+    runs go to worker processes. recorder (a BinaryTraceRecorder) records
+    every run; its path needs a '{run}' placeholder when workers > 1, and
+    the caller closes it when the study is done.
+    antithetic=True runs antithetic pairs: runs 2k-1 and 2k share the seed
+    replication_seed(seed, k), the second drawing from mirrored uniforms, so
+    num_runs must be even and first_run odd. calculate_overall_statistics
+    then averages each pair and reports the variance reduction.
+    cache (a ResultCache) returns runs it has seen before and stores the rest;
+    it is bypassed when tracing or recording, and cached runs skip the
+    first run's event log. store (a MappedResultStore) goes with
+    storage='mmap'; each run, in whichever process, writes its own segments.
+    """
+    if antithetic and (num_runs % 2 or first_run % 2 == 0):
+        raise ValueError("Antithetic runs come in pairs: num_runs must be even and first_run odd")
+    if verbose:
+        print(f"\n=== Running {num_runs} Simulations ===")
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if seed is None:
+        seed = random.randrange(2**64)
+
+    jobs = []
+    for run in range(first_run, first_run + num_runs):
+        run_seed = replication_seed(seed, (run + 1) // 2) if antithetic else replication_seed(seed, run)
+        jobs.append({
+            'num_tellers': num_tellers,
+            'mean_interarrival': mean_interarrival,
+            'mean_service_time': mean_service_time,
+            'sim_time': sim_time,
+            'run_number': run,
+            'verbose': verbose and run == 1,  # Show details only for first run
+            'seed': run_seed,
+            'engine': engine,
+            'storage': storage,
+            'variate_block': variate_block,
+            'tracer': tracer,
+            'recorder': recorder,
+            'warmup': warmup,
+            'antithetic': run % 2 == 0 if antithetic else None,
+            'store': store
+        })
+
+    if recorder is not None and (executor is not None or workers > 1) and '{run}' not in recorder.path:
+        raise ValueError("A recorder shared by worker processes needs '{run}' in its path")
+
+    if tracer is not None or recorder is not None or store is not None:
+        cache = None  # side effects (traces, segments) would not be reproduced by a cache hit
+    cached = {}
+    if cache is not None:
+        for job in jobs:
+            stats = cache.get(job)
+            if stats is not None:
+                cached[job['run_number']] = stats
+    pending = [job for job in jobs if job['run_number'] not in cached]
+
+    if executor is not None and pending:
+        chunksize = max(1, len(pending) // (workers * 4))
+        computed = list(executor.map(_run_replication, pending, chunksize=chunksize))
+    elif workers > 1 and len(pending) > 1:
+        workers = min(workers, len(pending))
+        chunksize = max(1, len(pending) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            computed = list(pool.map(_run_replication, pending, chunksize=chunksize))
+    else:
+        computed = [_run_replication(job) for job in pending]
+
+    for job, stats in zip(pending, computed):
+        cached[job['run_number']] = stats
+        if cache is not None:
+            cache.put(job, stats)
+    all_stats = [cached[job['run_number']] for job in jobs]
     
     return all_stats
 
 
+# === Sequential Stopping ===
+def run_until_precision(num_tellers, mean_interarrival, mean_service_time, sim_time, target_half_width=None, target_relative=None,
+                        min_runs=10, max_runs=1000, workers=1, seed=None, engine='simpy', storage='stream', variate_block=None,
+                        tracer=None, recorder=None, warmup=None, cache=None):
+    """Add replications in batches until the 95% CI of the mean waiting time is tight enough.
+
+    Stops once the CI half-width is at most target_half_width (minutes) and/or
+    target_relative times the mean (both must hold when both are given), or
+    when max_runs is reached. Returns (all_stats, overall_stats) where
+    overall_stats also reports 'runs_needed', 'ci_half_width' and 'converged'.
+    """
+    if target_half_width is None and target_relative is None:
+        raise ValueError("Give target_half_width and/or target_relative")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if seed is None:
+        seed = random.randrange(2**64)
+
+    def half_width_reached(half_width, mean):
+        return ((target_half_width is None or half_width <= target_half_width) and
+                (target_relative is None or half_width <= target_relative * abs(mean)))
+
+    all_stats = []
+    batch = min(max(min_runs, 2), max_runs)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while True:
+            all_stats.extend(run_multiple_simulations(num_tellers, mean_interarrival, mean_service_time, sim_time, batch,
+                                                      workers, seed, engine, storage, verbose=False,
+                                                      variate_block=variate_block, first_run=len(all_stats) + 1,
+                                                      executor=pool, tracer=tracer, recorder=recorder, warmup=warmup,
+                                                      cache=cache))
+            overall_stats = calculate_overall_statistics(all_stats)
+            mean = overall_stats['mean_avg_waiting_time']
+            half_width = (overall_stats['waiting_time_95ci_high'] - overall_stats['waiting_time_95ci_low']) / 2
+            converged = overall_stats['std_avg_waiting_time'] > 0 and half_width_reached(half_width, mean)
+            if converged or len(all_stats) >= max_runs:
+                break
+
+            # Size the next batch from the current variance estimate, in whole rounds of workers
+            targets = [t for t in (target_half_width, target_relative and target_relative * abs(mean)) if t]
+            needed = len(all_stats)
+            if targets and overall_stats['std_avg_waiting_time'] > 0:
+                needed = math.ceil((1.96 * overall_stats['std_avg_waiting_time'] / min(targets)) ** 2)
+            batch = max(needed - len(all_stats), workers, 1)
+            batch = min(math.ceil(batch / workers) * workers, max_runs - len(all_stats))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    overall_stats['runs_needed'] = len(all_stats)
+    overall_stats['ci_half_width'] = half_width
+    overall_stats['converged'] = converged
+    return all_stats, overall_stats
+
+
+# === Persisted Studies ===
+class Study:
+    """A replication study that can be saved and extended later without recomputing.
+
+    The state is the scenario, the master seed, the next run number (runs are
+    seeded with replication_seed(seed, run), so that is the whole position in
+    the seed sequence), the scalar summary of every run and the merged
+    streaming accumulators of all waiting and service times. extend() appends
+    replications and overall() gives the same statistics as
+    calculate_overall_statistics over every run so far.
+    """
+
+    def __init__(self, num_tellers, mean_interarrival, mean_service_time, sim_time, seed=None, engine='simpy',
+                 storage='stream', variate_block=None, warmup=None):
+        if storage not in ('stream', 'sketch'):
+            raise ValueError("Studies keep streaming accumulators: storage must be 'stream' or 'sketch'")
+        self.scenario = {'num_tellers': num_tellers, 'mean_interarrival': mean_interarrival,
+                         'mean_service_time': mean_service_time, 'sim_time': sim_time, 'engine': engine,
+                         'storage': storage, 'variate_block': variate_block, 'warmup': warmup}
+        self.seed = random.randrange(2**64) if seed is None else seed
+        self.next_run = 1
+        self.runs = []
+        self.waiting_stats = RunningStats(quantiles=(storage == 'sketch'))
+        self.service_stats = RunningStats()
+
+    def extend(self, num_runs, workers=1, executor=None, cache=None):
+        """Run num_runs more replications, continuing the seed sequence; returns their stats."""
+        scenario = self.scenario
+        new_stats = run_multiple_simulations(scenario['num_tellers'], scenario['mean_interarrival'],
+                                             scenario['mean_service_time'], scenario['sim_time'], num_runs, workers,
+                                             self.seed, scenario['engine'], scenario['storage'], verbose=False,
+                                             variate_block=scenario['variate_block'], first_run=self.next_run,
+                                             executor=executor, warmup=scenario['warmup'], cache=cache)
+        for stats in new_stats:
+            self.waiting_stats.merge(stats['waiting_stats'])
+            self.service_stats.merge(stats['service_stats'])
+            self.runs.append(_run_summary(stats))
+        self.next_run += num_runs
+        return new_stats
+
+    def overall(self, control_means=None):
+        """Overall statistics for every run so far (None before the first extend)."""
+        if not self.runs:
+            return None
+        merged = dict(self.runs[0], waiting_stats=self.waiting_stats, service_stats=self.service_stats)
+        return calculate_overall_statistics([merged] + self.runs[1:], control_means)
+
+    def save(self, path):
+        partial = f"{path}.{os.getpid()}.tmp"
+        with open(partial, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(partial, path)  # never leave a half-written study behind
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            study = pickle.load(f)
+        if not isinstance(study, cls):
+            raise ValueError(f"{path} does not contain a saved study")
+        return study
+
+
+# === Batch Means (single long run) ===
+def run_batch_means(num_tellers, mean_interarrival, mean_service_time, sim_time, seed=None, engine='simpy', warmup=None,
+                    variate_block=None, tracer=None, recorder=None):
+    """Estimate the steady-state mean wait from one long run instead of many replications.
+
+    The waiting times are streamed into a BatchMeans accumulator, so only one
+    warm-up is paid and memory stays constant. Returns (all_stats,
+    overall_stats) like run_until_precision; the 95% confidence interval in
+    overall_stats comes from the batch means, which also adds 'batch_count',
+    'batch_size', 'lag1_autocorrelation', 'batches_uncorrelated' and
+    'ci_half_width'.
+    """
+    stats = run_single_simulation(num_tellers, mean_interarrival, mean_service_time, sim_time, seed=seed, engine=engine,
+                                  storage='batch', variate_block=variate_block, tracer=tracer, recorder=recorder,
+                                  warmup=warmup)
+    result = stats['waiting_stats'].interval()
+    overall_stats = calculate_overall_statistics([stats])
+    overall_stats.update({
+        'waiting_time_95ci_low': result['mean'] - result['half_width'],
+        'waiting_time_95ci_high': result['mean'] + result['half_width'],
+        'ci_half_width': result['half_width'],
+        'batch_count': result['batches'],
+        'batch_size': result['batch_size'],
+        'lag1_autocorrelation': result['lag1_autocorrelation'],
+        'batches_uncorrelated': result['uncorrelated']
+    })
+    return [stats], overall_stats
+
+
+# === Analytic Validation ===
+VALIDATION_METRICS = ('avg_waiting_time', 'avg_queue_length', 'utilization')
+
+
+def validate_engines(num_tellers, mean_interarrival, mean_service_time, sim_time=10_000, num_runs=20, engines=None,
+                     seed=None, workers=1, confidence=0.99):
+    """Check every engine's steady-state estimates against the Erlang-C results.
+
+    Each engine runs num_runs replications with the first tenth of the horizon
+    as warm-up. A metric passes when the analytic value lies inside the
+    engine's t confidence interval. confidence holds for the whole family of
+    checks (Bonferroni), so correct engines fail any check at all at most 1%
+    of the time by default. Returns one row per (engine, metric) with
+    'simulated', 'half_width', 'analytic' and 'passed'.
+    """
+    analytic = mmc_metrics(num_tellers, mean_interarrival, mean_service_time)
+    if engines is None:
+        engines = [engine for engine in ENGINES if engine != 'numpy' or np is not None]
+    if seed is None:
+        seed = random.randrange(2**64)
+
+    checks = len(engines) * len(VALIDATION_METRICS)
+    t = _t_quantile(num_runs - 1, 1 - (1 - confidence) / checks)
+    rows = []
+    for engine in engines:
+        all_stats = run_multiple_simulations(num_tellers, mean_interarrival, mean_service_time, sim_time, num_runs,
+                                             workers=workers, seed=seed, engine=engine, storage='stream', verbose=False,
+                                             warmup=sim_time / 10)
+        for metric in VALIDATION_METRICS:
+            values = [stats[metric] for stats in all_stats]
+            mean = statistics.mean(values)
+            half_width = t * statistics.stdev(values) / num_runs ** 0.5
+            rows.append({'engine': engine, 'metric': metric, 'simulated': mean, 'half_width': half_width,
+                         'analytic': analytic[metric], 'passed': abs(mean - analytic[metric]) <= half_width})
+    return rows
+
+
+# === Staffing Optimization ===
+def erlang_c_staffing(mean_interarrival, mean_service_time, target_wait):
+    """Smallest stable teller count whose Erlang-C mean wait is at most target_wait."""
+    if target_wait <= 0:
+        raise ValueError("target_wait must be positive")
+    num_tellers = math.floor(mean_service_time / mean_interarrival) + 1
+    while mmc_metrics(num_tellers, mean_interarrival, mean_service_time, percentiles=())['avg_waiting_time'] > target_wait:
+        num_tellers += 1
+    return num_tellers
+
+
+def optimize_staffing(mean_interarrival, mean_service_time, sim_time, target_wait, initial_runs=10, max_runs=160, seed=None,
+                      engine='simpy', storage='stream', workers=1, variate_block=None, warmup=None, confidence=0.95,
+                      cache=None):
+    """Find the fewest tellers whose mean waiting time meets target_wait, simulating as little as possible.
+
+    The search starts at the Erlang-C staffing level and steps one teller at a
+    time towards the boundary (bracketing) until it finds adjacent counts c - 1
+    infeasible and c feasible; it never steps below the smallest stable count,
+    since Erlang C already rules those out. Each candidate is classified against the target
+    by a sequential feasibility check: it gets initial_runs replications, and
+    the count doubles, up to max_runs, while its t confidence interval still
+    straddles the target (at max_runs the point estimate decides). Every
+    count uses the same replication seeds (common random numbers), and
+    replications are cached per count, so revisiting a count or adding runs
+    never repeats a simulation; a ResultCache extends that across searches.
+
+    Returns a dict with 'num_tellers', 'erlang_c_tellers', 'total_runs' and
+    'evaluations' (one row per teller count tried, in order).
+    """
+    if seed is None:
+        seed = random.randrange(2**64)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    start = erlang_c_staffing(mean_interarrival, mean_service_time, target_wait)
+    min_stable = math.floor(mean_service_time / mean_interarrival) + 1
+    runs_by_count = {}
+    evaluations = []
+
+    def feasible(num_tellers):
+        runs = runs_by_count.setdefault(num_tellers, [])
+        while True:
+            batch = initial_runs if not runs else min(len(runs), max_runs - len(runs))
+            if batch > 0:
+                runs.extend(run_multiple_simulations(num_tellers, mean_interarrival, mean_service_time, sim_time, batch,
+                                                     workers, seed, engine, storage, verbose=False,
+                                                     variate_block=variate_block, first_run=len(runs) + 1,
+                                                     executor=pool, warmup=warmup, cache=cache))
+            waits = [stats['avg_waiting_time'] for stats in runs]
+            mean = statistics.mean(waits)
+            half_width = _t_quantile(len(waits) - 1, confidence) * statistics.stdev(waits) / len(waits) ** 0.5
+            if mean + half_width <= target_wait or mean - half_width > target_wait or len(runs) >= max_runs:
+                verdict = mean <= target_wait
+                evaluations.append({'num_tellers': num_tellers, 'runs': len(runs), 'mean_avg_waiting_time': mean,
+                                    'half_width': half_width, 'feasible': verdict})
+                return verdict
+
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        num_tellers = start
+        if feasible(num_tellers):
+            # Step down while one teller fewer still meets the target
+            while num_tellers > min_stable and feasible(num_tellers - 1):
+                num_tellers -= 1
+        else:
+            num_tellers += 1
+            while not feasible(num_tellers):
+                num_tellers += 1
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return {'num_tellers': num_tellers, 'erlang_c_tellers': start, 'total_runs': sum(len(runs) for runs in runs_by_count.values()),
+            'evaluations': evaluations}
+
+
+# === Parameter Sweeps ===
+SWEEP_PARAMETERS = ('num_tellers', 'mean_interarrival', 'mean_service_time')
+
+
+def expand_grid(grid):
+    """List every scenario (a dict of SWEEP_PARAMETERS) in the product of a {parameter: values} grid."""
+    unknown = set(grid) - set(SWEEP_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {', '.join(sorted(unknown))}")
+    missing = set(SWEEP_PARAMETERS) - set(grid)
+    if missing:
+        raise ValueError(f"Sweep grid is missing: {', '.join(sorted(missing))}")
+
+    values = [grid[key] if isinstance(grid[key], (list, tuple)) else [grid[key]] for key in SWEEP_PARAMETERS]
+    return [dict(zip(SWEEP_PARAMETERS, combo)) for combo in itertools.product(*values)]
+
+
+def iter_parameter_sweep(grid, sim_time, num_runs, workers=None, seed=None, engine='simpy', storage='stream', executor=None,
+                         variate_block=None, warmup=None, common_random_numbers=False, cache=None):
+    """Yield (scenario_index, scenario, stats) for every replication as soon as it finishes.
+
+    All (scenario, replication) tasks go to a single process pool: the given
+    executor if any (so several sweeps can share it), otherwise one created for
+    the whole sweep. workers=1 runs everything in-process.
+    common_random_numbers=True gives replication r of every scenario the same
+    seed, so the scenarios see the same arrival and service streams.
+    cache (a ResultCache) yields already computed replications first and
+    stores the new ones.
+    """
+    scenarios = expand_grid(grid)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if seed is None:
+        seed = random.randrange(2**64)
+
+    tasks = []
+    for index, scenario in enumerate(scenarios):
+        for run in range(1, num_runs + 1):
+            run_seed = replication_seed(seed, run) if common_random_numbers else replication_seed(seed, 'scenario', index, run)
+            job = dict(scenario, sim_time=sim_time, run_number=run, seed=run_seed, engine=engine, storage=storage,
+                       variate_block=variate_block, warmup=warmup)
+            tasks.append((index, job))
+    # Busiest scenarios first so the pool drains evenly at the end
+    tasks.sort(key=lambda task: task[1]['mean_interarrival'])
+
+    if cache is not None:
+        pending = []
+        for index, job in tasks:
+            stats = cache.get(job)
+            if stats is None:
+                pending.append((index, job))
+            else:
+                yield index, scenarios[index], stats
+        tasks = pending
+
+    if executor is None and workers == 1:
+        for index, job in tasks:
+            stats = _run_replication(job)
+            if cache is not None:
+                cache.put(job, stats)
+            yield index, scenarios[index], stats
+        return
+    if not tasks:
+        return
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = {executor.submit(_run_replication, job): (index, job) for index, job in tasks}
+        for future in as_completed(futures):
+            index, job = futures[future]
+            stats = future.result()
+            if cache is not None:
+                cache.put(job, stats)
+            yield index, scenarios[index], stats
+    finally:
+        if own_executor:
+            executor.shutdown(cancel_futures=True)
+
+
+def run_parameter_sweep(grid, sim_time, num_runs, workers=None, seed=None, engine='simpy', storage='stream', executor=None, on_result=None,
+                        variate_block=None, warmup=None, common_random_numbers=False, cache=None):
+    """Run a num_tellers x mean_interarrival x mean_service_time grid on one worker pool.
+
+    Returns (run_rows, scenario_rows): one tidy row per replication in
+    completion order, and one row per scenario with its overall statistics.
+    on_result(row) is called with each replication row as it arrives.
+    """
+    scenarios = expand_grid(grid)
+    per_scenario = [[] for _ in scenarios]
+    run_rows = []
+    for index, scenario, stats in iter_parameter_sweep(grid, sim_time, num_runs, workers, seed, engine, storage, executor,
+                                                       variate_block, warmup, common_random_numbers, cache):
+        row = dict(scenario, **_run_summary(stats))
+        run_rows.append(row)
+        per_scenario[index].append(stats)
+        if on_result is not None:
+            on_result(row)
+
+    scenario_rows = []
+    for scenario, scenario_stats in zip(scenarios, per_scenario):
+        scenario_stats.sort(key=lambda stats: stats['run_number'])
+        scenario_rows.append(dict(scenario, **calculate_overall_statistics(scenario_stats)))
+    return run_rows, scenario_rows
+
+
+# === Paired Comparisons (common random numbers) ===
+COMPARISON_METRICS = ('avg_waiting_time', 'avg_queue_length', 'utilization')
+
+
+def compare_scenarios(grid, sim_time, num_runs, baseline=0, metrics=COMPARISON_METRICS, workers=None, seed=None,
+                      engine='simpy', storage='stream', executor=None, variate_block=None, warmup=None, cache=None):
+    """Compare every scenario of a grid with the baseline one on common random numbers.
+
+    Replication r of every scenario uses the same arrival and service streams,
+    so each scenario-minus-baseline difference is paired by replication and
+    the shared randomness cancels out of its variance. Returns
+    (scenario_rows, comparison_rows): the per-scenario overall statistics and
+    one row per (scenario, metric) with the mean paired difference, its 95%
+    t confidence interval, whether the interval excludes zero, and the
+    half-width independent replications would have given for reference.
+    """
+    scenarios = expand_grid(grid)
+    if num_runs < 2:
+        raise ValueError("Paired comparisons need at least 2 runs")
+    per_scenario = [{} for _ in scenarios]
+    for index, scenario, stats in iter_parameter_sweep(grid, sim_time, num_runs, workers, seed, engine, storage, executor,
+                                                       variate_block, warmup, common_random_numbers=True, cache=cache):
+        per_scenario[index][stats['run_number']] = stats
+
+    scenario_rows = [dict(scenario, **calculate_overall_statistics([runs[run] for run in sorted(runs)]))
+                     for scenario, runs in zip(scenarios, per_scenario)]
+    t = _t_quantile(num_runs - 1)
+    comparison_rows = []
+    base_runs = per_scenario[baseline]
+    for index, (scenario, runs) in enumerate(zip(scenarios, per_scenario)):
+        if index == baseline:
+            continue
+        for metric in metrics:
+            values = [runs[run][metric] for run in sorted(runs)]
+            base_values = [base_runs[run][metric] for run in sorted(runs)]
+            differences = [value - base for value, base in zip(values, base_values)]
+            mean = statistics.mean(differences)
+            half_width = t * statistics.stdev(differences) / num_runs ** 0.5
+            independent = t * ((statistics.variance(values) + statistics.variance(base_values)) / num_runs) ** 0.5
+            comparison_rows.append(dict(scenario, metric=metric,
+                                        baseline=', '.join(f"{key}={scenarios[baseline][key]}" for key in SWEEP_PARAMETERS),
+                                        mean_difference=mean, ci_low=mean - half_width, ci_high=mean + half_width,
+                                        significant=abs(mean) > half_width, independent_half_width=independent))
+    return scenario_rows, comparison_rows
+
+
+# === Control Variates ===
+def known_control_means(mean_interarrival, mean_service_time, sim_time, warmup=None):
+    """Exact expectations of per-run outputs that can serve as control variates.
+
+    The mean service time is an input, and arrivals over the observed horizon
+    are Poisson with mean horizon / mean_interarrival; the arrival count is
+    left out for warmup='mser5', whose observed horizon is random.
+    """
+    means = {'avg_service_time': mean_service_time}
+    if warmup != 'mser5':
+        means['customers_arrived'] = (sim_time - float(warmup or 0)) / mean_interarrival
+    return means
+
+
+def _solve_linear(matrix, vector):
+    """Solve a small dense system by Gaussian elimination with partial pivoting."""
+    size = len(vector)
+    rows = [list(row) + [value] for row, value in zip(matrix, vector)]
+    for col in range(size):
+        pivot = max(range(col, size), key=lambda row: abs(rows[row][col]))
+        if abs(rows[pivot][col]) < 1e-300:
+            raise ValueError("Control variates are collinear or constant")
+        rows[col], rows[pivot] = rows[pivot], rows[col]
+        for row in range(col + 1, size):
+            factor = rows[row][col] / rows[col][col]
+            for k in range(col, size + 1):
+                rows[row][k] -= factor * rows[col][k]
+    solution = [0.0] * size
+    for row in range(size - 1, -1, -1):
+        solution[row] = (rows[row][size] - sum(rows[row][k] * solution[k] for k in range(row + 1, size))) / rows[row][row]
+    return solution
+
+
+def control_variate_estimate(responses, controls, control_means):
+    """Regression-adjusted mean of responses and its standard error.
+
+    controls holds one sequence per control variate (aligned with responses)
+    and control_means their known expectations. The coefficients are the
+    least-squares slopes of the responses on the controls, and the variance
+    follows Lavenberg and Welch: S_e^2 (1/n + d' S_xx^-1 d), with d the
+    deviation of the control averages from their means. Confidence intervals
+    use a t distribution with n - q - 1 degrees of freedom.
+    """
+    n, q = len(responses), len(controls)
+    if n < q + 2:
+        raise ValueError(f"{q} control variate(s) need at least {q + 2} runs")
+    y_bar = math.fsum(responses) / n
+    x_bars = [math.fsum(control) / n for control in controls]
+    y_dev = [y - y_bar for y in responses]
+    x_devs = [[x - x_bar for x in control] for control, x_bar in zip(controls, x_bars)]
+
+    s_xx = [[math.fsum(a * b for a, b in zip(x_devs[i], x_devs[j])) for j in range(q)] for i in range(q)]
+    s_xy = [math.fsum(a * b for a, b in zip(x_devs[i], y_dev)) for i in range(q)]
+    beta = _solve_linear(s_xx, s_xy)
+    deviations = [x_bar - mu for x_bar, mu in zip(x_bars, control_means)]
+    estimate = y_bar - math.fsum(b * d for b, d in zip(beta, deviations))
+
+    residuals = [y - math.fsum(b * x_dev[i] for b, x_dev in zip(beta, x_devs)) for i, y in enumerate(y_dev)]
+    residual_variance = math.fsum(r * r for r in residuals) / (n - q - 1)
+    spread = math.fsum(d * w for d, w in zip(deviations, _solve_linear(s_xx, deviations)))
+    return estimate, (residual_variance * (1 / n + spread)) ** 0.5
+
+
 # === Calculate Overall Statistics ===
-def calculate_overall_statistics(all_stats):
-    """Calculate overall statistics from all simulation runs."""
+def calculate_overall_statistics(all_stats, control_means=None):
+    """Calculate overall statistics from all simulation runs.
+
+    control_means ({stats key: known expectation}, see known_control_means)
+    adds a control-variate estimate of the mean waiting time next to the raw
+    one: 'cv_mean_avg_waiting_time', its 95% CI and 'cv_variance_reduction'.
+    """
     if not all_stats:
         return None
     
@@ -130,12 +2322,30 @@ def calculate_overall_statistics(all_stats):
     customers_served = [stats['customers_served'] for stats in all_stats]
     avg_service_times = [stats['avg_service_time'] for stats in all_stats if stats['customers_served'] > 0]
     
-    # Flatten all waiting times for overall statistics
-    all_waiting_times = []
-    all_service_times = []
-    for stats in all_stats:
-        all_waiting_times.extend(stats['waiting_times'])
-        all_service_times.extend(stats['service_times'])
+    # Combine per-customer samples across runs (merge accumulators when runs streamed)
+    streamed = any('waiting_stats' in stats or 'waiting_segment' in stats for stats in all_stats)
+    if streamed:
+        quantiles = all(stats['waiting_stats'].sketch is not None for stats in all_stats if 'waiting_stats' in stats)
+        waiting_summary = RunningStats(quantiles=quantiles)
+        service_summary = RunningStats()
+        for stats in all_stats:
+            if 'waiting_stats' in stats:
+                waiting_summary.merge(stats['waiting_stats'])
+                service_summary.merge(stats['service_stats'])
+            elif 'waiting_segment' in stats:
+                # Zero-copy chunks of the memory-mapped segments
+                for chunk in _iter_mapped_chunks([stats['waiting_segment']]):
+                    waiting_summary.extend(chunk)
+                for chunk in _iter_mapped_chunks([stats['service_segment']]):
+                    service_summary.extend(chunk)
+            elif 'waiting_times' in stats:
+                waiting_summary.extend(stats['waiting_times'])
+                service_summary.extend(stats['service_times'])
+            # else: a scalar run summary whose samples are merged elsewhere (see Study)
+    else:
+        # Flatten all waiting times for overall statistics
+        all_waiting_times = _concatenate_samples([stats['waiting_times'] for stats in all_stats])
+        all_service_times = _concatenate_samples([stats['service_times'] for stats in all_stats])
     
     overall_stats = {
         'total_runs': len(all_stats),
@@ -149,15 +2359,58 @@ def calculate_overall_statistics(all_stats):
         'mean_max_waiting_time': statistics.mean(max_waiting_times) if max_waiting_times else 0,
         'mean_avg_service_time': statistics.mean(avg_service_times) if avg_service_times else 0,
         
-        # Overall statistics (all customers across all runs)
-        'overall_avg_waiting_time': statistics.mean(all_waiting_times) if all_waiting_times else 0,
-        'overall_max_waiting_time': max(all_waiting_times) if all_waiting_times else 0,
-        'overall_avg_service_time': statistics.mean(all_service_times) if all_service_times else 0,
-        
         # Confidence intervals (simplified)
         'waiting_time_95ci_low': statistics.mean(avg_waiting_times) - 1.96 * statistics.stdev(avg_waiting_times) / (len(avg_waiting_times) ** 0.5) if len(avg_waiting_times) > 1 else 0,
         'waiting_time_95ci_high': statistics.mean(avg_waiting_times) + 1.96 * statistics.stdev(avg_waiting_times) / (len(avg_waiting_times) ** 0.5) if len(avg_waiting_times) > 1 else 0
     }
+
+    # Antithetic pairs: the pair averages are the independent observations
+    pairs = {}
+    for stats in all_stats:
+        if 'antithetic' in stats and stats['customers_served'] > 0:
+            pairs.setdefault((stats['run_number'] + 1) // 2, []).append(stats['avg_waiting_time'])
+    pair_means = [sum(pair) / 2 for pair in pairs.values() if len(pair) == 2]
+    if len(pair_means) > 1:
+        half_width = 1.96 * statistics.stdev(pair_means) / len(pair_means) ** 0.5
+        overall_stats['waiting_time_95ci_low'] = statistics.mean(pair_means) - half_width
+        overall_stats['waiting_time_95ci_high'] = statistics.mean(pair_means) + half_width
+        overall_stats['antithetic_pairs'] = len(pair_means)
+        # Variance of the mean from 2n independent runs over that from n antithetic pairs
+        pair_variance = statistics.variance(pair_means)
+        overall_stats['variance_reduction'] = (statistics.variance(avg_waiting_times) / 2 / pair_variance
+                                               if pair_variance > 0 else math.inf)
+
+    # Control-variate adjustment of the across-run mean wait
+    if control_means:
+        runs = [stats for stats in all_stats if stats['customers_served'] > 0]
+        controls = [[stats[key] for stats in runs] for key in control_means]
+        estimate, standard_error = control_variate_estimate(avg_waiting_times, controls, list(control_means.values()))
+        half_width = _t_quantile(len(runs) - len(control_means) - 1) * standard_error
+        raw_variance = statistics.variance(avg_waiting_times) / len(avg_waiting_times)
+        cv_variance = standard_error ** 2
+        overall_stats['cv_mean_avg_waiting_time'] = estimate
+        overall_stats['cv_waiting_time_95ci_low'] = estimate - half_width
+        overall_stats['cv_waiting_time_95ci_high'] = estimate + half_width
+        overall_stats['cv_variance_reduction'] = raw_variance / cv_variance if cv_variance > 0 else math.inf
+
+    # Time-weighted queue statistics (across-run averages)
+    for key in ('avg_queue_length', 'avg_in_system', 'utilization'):
+        values = [stats[key] for stats in all_stats if key in stats]
+        if len(values) == len(all_stats):
+            overall_stats[f'mean_{key}'] = statistics.mean(values)
+
+    # Overall statistics (all customers across all runs)
+    if streamed:
+        overall_stats['overall_avg_waiting_time'] = waiting_summary.mean if waiting_summary.count else 0
+        overall_stats['overall_max_waiting_time'] = waiting_summary.max if waiting_summary.count else 0
+        overall_stats['overall_avg_service_time'] = service_summary.mean if service_summary.count else 0
+        if waiting_summary.sketch is not None:
+            for q in (50, 90, 95, 99):
+                overall_stats[f'overall_waiting_time_p{q}'] = waiting_summary.quantile(q / 100)
+    else:
+        overall_stats['overall_avg_waiting_time'] = _sample_mean(all_waiting_times)
+        overall_stats['overall_max_waiting_time'] = _sample_max(all_waiting_times)
+        overall_stats['overall_avg_service_time'] = _sample_mean(all_service_times)
     
     return overall_stats
 
@@ -173,11 +2426,39 @@ def display_results(all_stats, overall_stats, num_tellers):
     print(f"Average customers per run: {overall_stats['avg_customers_per_run']:.1f}")
     
     print(f"\n--- Waiting Time Statistics ---")
-    print(f"Average waiting time (across runs): {overall_stats['mean_avg_waiting_time']:.2f} ± {overall_stats['std_avg_waiting_time']:.2f} minutes")
+    if 'batch_count' in overall_stats:
+        print(f"Average waiting time: {overall_stats['mean_avg_waiting_time']:.2f} minutes")
+    else:
+        print(f"Average waiting time (across runs): {overall_stats['mean_avg_waiting_time']:.2f} ± {overall_stats['std_avg_waiting_time']:.2f} minutes")
     print(f"95% Confidence Interval: [{overall_stats['waiting_time_95ci_low']:.2f}, {overall_stats['waiting_time_95ci_high']:.2f}] minutes")
+    if 'batch_count' in overall_stats:
+        check = "passed" if overall_stats['batches_uncorrelated'] else "FAILED (run longer)"
+        print(f"Batch means: {overall_stats['batch_count']} batches of {overall_stats['batch_size']} customers, "
+              f"lag-1 autocorrelation {overall_stats['lag1_autocorrelation']:.3f} ({check})")
+    if 'cv_mean_avg_waiting_time' in overall_stats:
+        print(f"Control-variate estimate: {overall_stats['cv_mean_avg_waiting_time']:.2f} minutes, "
+              f"95% CI [{overall_stats['cv_waiting_time_95ci_low']:.2f}, {overall_stats['cv_waiting_time_95ci_high']:.2f}] "
+              f"(variance reduction x{overall_stats['cv_variance_reduction']:.2f})")
+    if 'antithetic_pairs' in overall_stats:
+        print(f"Antithetic pairs: {overall_stats['antithetic_pairs']}, CI from pair averages "
+              f"(variance reduction x{overall_stats['variance_reduction']:.2f} vs independent runs)")
+    if 'runs_needed' in overall_stats:
+        status = "reached" if overall_stats['converged'] else "NOT reached (run budget exhausted)"
+        print(f"Target precision {status} after {overall_stats['runs_needed']} runs "
+              f"(half-width {overall_stats['ci_half_width']:.3f} minutes)")
     print(f"Average maximum waiting time: {overall_stats['mean_max_waiting_time']:.2f} minutes")
     print(f"Overall average waiting time (all customers): {overall_stats['overall_avg_waiting_time']:.2f} minutes")
     print(f"Overall maximum waiting time: {overall_stats['overall_max_waiting_time']:.2f} minutes")
+    if 'overall_waiting_time_p50' in overall_stats:
+        print(f"Waiting time percentiles (P50/P90/P95/P99): {overall_stats['overall_waiting_time_p50']:.2f} / "
+              f"{overall_stats['overall_waiting_time_p90']:.2f} / {overall_stats['overall_waiting_time_p95']:.2f} / "
+              f"{overall_stats['overall_waiting_time_p99']:.2f} minutes")
+    
+    if 'mean_avg_queue_length' in overall_stats:
+        print(f"\n--- Queue Statistics (time-weighted) ---")
+        print(f"Average queue length (Lq): {overall_stats['mean_avg_queue_length']:.2f} customers")
+        print(f"Average number in system (L): {overall_stats['mean_avg_in_system']:.2f} customers")
+        print(f"Teller utilization: {overall_stats['mean_utilization']:.1%}")
     
     print(f"\n--- Service Time Statistics ---")
     print(f"Average service time: {overall_stats['mean_avg_service_time']:.2f} minutes")
@@ -194,23 +2475,580 @@ def display_results(all_stats, overall_stats, num_tellers):
             print(f"Run {stats['run_number']:2d}: No customers served")
 
 
-# === Main Program ===
-if __name__ == "__main__":
-    # Step 1: Get parameters
-    num_tellers, mean_interarrival, mean_service_time, sim_time, num_runs = get_simulation_parameters()
+def display_sweep_results(scenario_rows):
+    """Display one line per scenario of a parameter sweep."""
+    print(f"\n{'='*72}")
+    print(f"PARAMETER SWEEP - {len(scenario_rows)} Scenarios")
+    print(f"{'='*72}")
+    print(f"{'Tellers':>7} {'Interarr.':>9} {'Service':>8} {'Runs':>5} {'Avg wait':>9} {'95% CI':>19} {'Max wait':>9}")
+    for row in scenario_rows:
+        print(f"{row['num_tellers']:7d} {row['mean_interarrival']:9.2f} {row['mean_service_time']:8.2f} "
+              f"{row['total_runs']:5d} {row['mean_avg_waiting_time']:9.2f} "
+              f"[{row['waiting_time_95ci_low']:7.2f}, {row['waiting_time_95ci_high']:7.2f}] "
+              f"{row['overall_max_waiting_time']:9.2f}")
+
+
+def display_comparison(comparison_rows):
+    """Display paired differences against the baseline scenario."""
+    print(f"\n{'='*84}")
+    print(f"PAIRED COMPARISON (common random numbers) - baseline {comparison_rows[0]['baseline']}")
+    print(f"{'='*84}")
+    print(f"{'Tellers':>7} {'Interarr.':>9} {'Service':>8} {'Metric':>17} {'Difference':>11} {'95% CI':>21} "
+          f"{'Indep. +/-':>10}")
+    for row in comparison_rows:
+        flag = ' *' if row['significant'] else ''
+        print(f"{row['num_tellers']:7d} {row['mean_interarrival']:9.2f} {row['mean_service_time']:8.2f} "
+              f"{row['metric']:>17} {row['mean_difference']:11.3f} [{row['ci_low']:8.3f}, {row['ci_high']:8.3f}] "
+              f"{row['independent_half_width']:10.3f}{flag}")
+    print("* the confidence interval excludes zero")
+
+
+def display_analytic(metrics, num_tellers, mean_interarrival, mean_service_time):
+    """Display steady-state Erlang-C results."""
+    print(f"\n{'='*60}")
+    print(f"ANALYTIC M/M/c (Erlang C) - {num_tellers} tellers, interarrival {mean_interarrival:g}, "
+          f"service {mean_service_time:g}")
+    print(f"{'='*60}")
+    print(f"Teller utilization: {metrics['utilization']:.1%}")
+    print(f"Probability of waiting: {metrics['prob_wait']:.1%}")
+    print(f"Average waiting time (Wq): {metrics['avg_waiting_time']:.3f} minutes")
+    print(f"Average time in bank (W): {metrics['avg_time_in_system']:.3f} minutes")
+    print(f"Average queue length (Lq): {metrics['avg_queue_length']:.3f} customers")
+    print(f"Average number in system (L): {metrics['avg_in_system']:.3f} customers")
+    print(f"Waiting time percentiles (P50/P90/P95/P99): {metrics['waiting_time_p50']:.2f} / "
+          f"{metrics['waiting_time_p90']:.2f} / {metrics['waiting_time_p95']:.2f} / {metrics['waiting_time_p99']:.2f} minutes")
+
+
+def display_validation(rows):
+    """Display engine estimates next to the Erlang-C values."""
+    print(f"\n{'='*72}")
+    print("ENGINE VALIDATION against Erlang C")
+    print(f"{'='*72}")
+    print(f"{'Engine':>8} {'Metric':>17} {'Simulated':>10} {'+/-':>8} {'Analytic':>10} {'Result':>7}")
+    for row in rows:
+        print(f"{row['engine']:>8} {row['metric']:>17} {row['simulated']:10.4f} {row['half_width']:8.4f} "
+              f"{row['analytic']:10.4f} {'ok' if row['passed'] else 'FAIL':>7}")
+
+
+def display_staffing(rows, target_wait):
+    """Display the recommended teller count for each time slot."""
+    print(f"\n{'='*72}")
+    print(f"STAFFING - fewest tellers with mean wait <= {target_wait:g} minutes")
+    print(f"{'='*72}")
+    print(f"{'Interarr.':>9} {'Service':>8} {'Erlang C':>8} {'Tellers':>7} {'Avg wait':>9} {'+/-':>7} {'Runs':>6}")
+    for row in rows:
+        print(f"{row['mean_interarrival']:9.2f} {row['mean_service_time']:8.2f} {row['erlang_c_tellers']:8d} "
+              f"{row['num_tellers']:7d} {row['mean_avg_waiting_time']:9.2f} {row['half_width']:7.2f} {row['total_runs']:6d}")
+
+
+def display_replay(runs):
+    """Display statistics reconstructed from a binary trace."""
+    print(f"{'Run':>4} {'Tellers':>7} {'Customers':>9} {'Avg wait':>9} {'Max wait':>9} {'Avg queue':>9} {'Max queue':>9} {'Util.':>6}")
+    for run in runs:
+        print(f"{run['run_number']:4d} {run['num_tellers']:7d} {run['customers_served']:9d} {run['avg_waiting_time']:9.2f} "
+              f"{run['max_waiting_time']:9.2f} {run['avg_queue_length']:9.2f} {run['max_queue_length']:9d} "
+              f"{run['utilization']:6.1%}")
+
+
+# === Command-Line Interface ===
+DEFAULT_PARAMETERS = {
+    'tellers': 3,
+    'interarrival': 1.0,
+    'service': 2.0,
+    'horizon': 480.0,
+    'runs': 10,
+    'seed': None,
+    'engine': 'simpy',
+    'storage': 'list',
+    'workers': 1,
+    'variate_block': None,
+    'precision': None,
+    'relative_precision': None,
+    'max_runs': 1000,
+    'batch_means': False,
+    'paired': False,
+    'antithetic': False,
+    'control_variates': False,
+    'analytic': False,
+    'validate': False,
+    'target_wait': None,
+    'cache': None,
+    'cache_size': 256,
+    'study': None,
+    'export_runs': None,
+    'export_customers': None,
+    'store': None,
+    'trace': None,
+    'trace_level': 'event',
+    'trace_sample': 1,
+    'record': None,
+    'warmup': None,
+    'format': 'text',
+    'output': None
+}
+
+
+def load_config(path):
+    """Load scenario parameters from a TOML or JSON file.
+
+    Keys match the long command-line options (tellers, interarrival, service,
+    horizon, runs, seed, engine, storage, workers, variate_block, precision,
+    relative_precision, max_runs, batch_means, paired, antithetic,
+    control_variates, analytic, validate, target_wait, cache, cache_size,
+    study, export_runs, export_customers, store, trace, trace_level,
+    trace_sample, record, warmup, format, output), either at the top level or
+    inside a [simulation] table.
+    """
+    if path.endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            import tomli as tomllib
+        with open(path, 'rb') as f:
+            config = tomllib.load(f)
+    else:
+        with open(path) as f:
+            config = json.load(f)
+
+    config = config.get('simulation', config)
+    unknown = set(config) - set(DEFAULT_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown config keys in {path}: {', '.join(sorted(unknown))}")
+    return config
+
+
+def _warmup_value(text):
+    return text if text == 'mser5' else float(text)
+
+
+def build_parser():
+    """Argument parser for the non-interactive entry point."""
+    parser = argparse.ArgumentParser(description="Bank queue simulation (M/M/c) with multiple runs. "
+                                                 "Several values for --tellers/--interarrival/--service run a sweep.")
+    parser.add_argument('--config', help="TOML or JSON file with scenario parameters (flags override it)")
+    parser.add_argument('--interactive', action='store_true', help="prompt for parameters like the original script")
+    parser.add_argument('-c', '--tellers', type=int, nargs='+', help="number of tellers (default 3)")
+    parser.add_argument('-a', '--interarrival', type=float, nargs='+', help="mean interarrival time in minutes (default 1)")
+    parser.add_argument('-s', '--service', type=float, nargs='+', help="mean service time in minutes (default 2)")
+    parser.add_argument('-t', '--horizon', type=float, help="simulation time per run in minutes (default 480)")
+    parser.add_argument('-n', '--runs', type=int, help="number of simulation runs (default 10)")
+    parser.add_argument('--seed', type=int, help="master random seed for reproducible runs")
+    parser.add_argument('--engine', choices=ENGINES, help="simulation engine (default simpy)")
+    parser.add_argument('--storage', choices=STORAGE_MODES, help="per-customer sample storage (default list)")
+    parser.add_argument('-w', '--workers', type=int, help="worker processes, 0 = all cores (default 1)")
+    parser.add_argument('--variate-block', type=int, dest='variate_block',
+                        help="draw random variates in blocks of this size (simpy engine)")
+    parser.add_argument('--warmup', type=_warmup_value,
+                        help="warm-up to discard: minutes, or 'mser5' to detect it automatically")
+    parser.add_argument('--precision', type=float,
+                        help="keep adding runs until the 95%% CI half-width of the mean wait is at most this (minutes)")
+    parser.add_argument('--relative-precision', type=float, dest='relative_precision',
+                        help="keep adding runs until the CI half-width is at most this fraction of the mean wait")
+    parser.add_argument('--max-runs', type=int, dest='max_runs', help="run budget for --precision modes (default 1000)")
+    parser.add_argument('--batch-means', action='store_true', default=None, dest='batch_means',
+                        help="one long run of --horizon minutes with a batch-means confidence interval")
+    parser.add_argument('--paired', action='store_true', default=None,
+                        help="sweeps: compare each scenario with the first on common random numbers")
+    parser.add_argument('--antithetic', action='store_true', default=None,
+                        help="run antithetic pairs (--runs must be even) and report the variance reduction")
+    parser.add_argument('--control-variates', action='store_true', default=None, dest='control_variates',
+                        help="also estimate the mean wait with service-time and arrival-count control variates")
+    parser.add_argument('--analytic', action='store_true', default=None,
+                        help="print the steady-state Erlang-C results instead of simulating")
+    parser.add_argument('--validate', action='store_true', default=None,
+                        help="check every engine against Erlang C (--runs replications of --horizon); exit 1 on failure")
+    parser.add_argument('--target-wait', type=float, dest='target_wait',
+                        help="find the fewest tellers with a mean wait at most this (minutes), per "
+                             "--interarrival/--service slot; --runs is the first batch, --max-runs the cap")
+    parser.add_argument('--cache', metavar='DIR', help="reuse replications already computed with the same seed from this directory")
+    parser.add_argument('--cache-size', type=float, dest='cache_size', metavar='MB',
+                        help="evict least recently used cache entries beyond this size (default 256)")
+    parser.add_argument('--study', metavar='FILE',
+                        help="add --runs replications to the study saved in FILE (created on first use) and report all")
+    parser.add_argument('--store', metavar='DIR',
+                        help="with --storage mmap: directory for the per-run memory-mapped sample segments")
+    parser.add_argument('--trace', help="append an event trace of every run to this file")
+    parser.add_argument('--trace-level', dest='trace_level', choices=tuple(TRACE_LEVELS),
+                        help="'run' for run summaries only, 'event' for every customer event (default)")
+    parser.add_argument('--trace-sample', type=int, dest='trace_sample',
+                        help="trace only every N-th customer (default 1)")
+    parser.add_argument('--record',
+                        help="record a binary per-customer trace to this file ('{run}' in the name = one file per run)")
+    parser.add_argument('--export-runs', dest='export_runs', metavar='FILE',
+                        help="write per-run summaries to a .npz, .parquet or .arrow file")
+    parser.add_argument('--export-customers', dest='export_customers', metavar='FILE',
+                        help="write one row per served customer to a .npz, .parquet or .arrow file, in chunks "
+                             "('{run}' in the name = one file per run)")
+    parser.add_argument('--replay', metavar='TRACE', help="summarize a recorded binary trace and exit")
+    parser.add_argument('-f', '--format', choices=('text', 'json', 'csv'), help="output format (default text)")
+    parser.add_argument('-o', '--output', help="write results to this file instead of stdout")
+    return parser
+
+
+def resolve_parameters(args):
+    """Merge defaults, config file and command-line flags (in increasing priority)."""
+    params = dict(DEFAULT_PARAMETERS)
+    if args.config:
+        params.update(load_config(args.config))
+    for key in DEFAULT_PARAMETERS:
+        value = getattr(args, key)
+        if value is not None:
+            params[key] = value
+
+    # Scenario parameters may be lists (a sweep); a single value is kept as a scalar
+    for key in ('tellers', 'interarrival', 'service'):
+        if isinstance(params[key], (list, tuple)) and len(params[key]) == 1:
+            params[key] = params[key][0]
+
+    def values(key):
+        return params[key] if isinstance(params[key], (list, tuple)) else [params[key]]
+
+    if min(values('tellers')) < 1 or params['runs'] < 1:
+        raise ValueError("tellers and runs must be at least 1")
+    if min(values('interarrival') + values('service')) <= 0 or params['horizon'] <= 0:
+        raise ValueError("interarrival, service and horizon must be positive")
+    if params['workers'] < 0:
+        raise ValueError("workers must be 0 (all cores) or positive")
+    if params['cache_size'] <= 0:
+        raise ValueError("cache_size must be positive")
+    warmup = params['warmup']
+    if warmup is not None and warmup != 'mser5' and not 0 <= float(warmup) < params['horizon']:
+        raise ValueError("warmup must be 'mser5' or a time between 0 and the horizon")
+    if params['batch_means'] and (params['precision'] is not None or params['relative_precision'] is not None):
+        raise ValueError("--batch-means cannot be combined with --precision or --relative-precision")
+    sweep = max(len(values(key)) for key in ('tellers', 'interarrival', 'service')) > 1
+    if params['antithetic'] and (params['runs'] % 2 or sweep or params['batch_means'] or
+                                 params['precision'] is not None or params['relative_precision'] is not None):
+        raise ValueError("--antithetic needs an even --runs and a single scenario with a fixed number of runs")
+    if params['control_variates'] and (params['runs'] < 4 or sweep or params['batch_means'] or params['antithetic'] or
+                                       params['precision'] is not None or params['relative_precision'] is not None):
+        raise ValueError("--control-variates needs at least 4 independent runs of a single scenario")
+    if params['target_wait'] is not None and (params['target_wait'] <= 0 or params['runs'] < 2):
+        raise ValueError("--target-wait must be positive and needs at least 2 runs")
+    if (params['analytic'] or params['validate']) and sweep:
+        raise ValueError("--analytic and --validate take a single scenario")
+    if params['validate'] and params['runs'] < 2:
+        raise ValueError("--validate needs at least 2 runs")
+    if params['study'] and (sweep or params['antithetic'] or params['batch_means'] or params['trace'] or params['record'] or
+                            params['export_customers'] or
+                            params['precision'] is not None or params['relative_precision'] is not None):
+        raise ValueError("--study extends a single fixed-size study without tracing or recording")
+    if params['paired'] and (params['runs'] < 2 or not sweep):
+        raise ValueError("--paired needs a sweep (several values for a parameter) and at least 2 runs")
+    if params['record'] and params['workers'] != 1 and '{run}' not in params['record']:
+        raise ValueError("--record needs a '{run}' placeholder in the file name when workers != 1")
+    if (params['storage'] == 'mmap') != bool(params['store']):
+        raise ValueError("--storage mmap and --store DIR go together")
+    if params['store'] and (sweep or params['study'] or params['batch_means'] or params['target_wait'] is not None or
+                            params['precision'] is not None or params['relative_precision'] is not None):
+        raise ValueError("--storage mmap works with fixed-size studies of a single scenario")
+    for key in ('export_runs', 'export_customers'):
+        if params[key]:
+            _columnar_format(params[key])
+    if params['export_customers'] and (params['record'] or sweep):
+        raise ValueError("--export-customers cannot be combined with --record or a sweep")
+    if params['export_customers'] and params['workers'] != 1 and '{run}' not in params['export_customers']:
+        raise ValueError("--export-customers needs a '{run}' placeholder in the file name when workers != 1")
+    if params['export_runs'] and (params['paired'] or params['analytic'] or params['validate'] or
+                                  params['target_wait'] is not None):
+        raise ValueError("--export-runs is not available with --paired, --analytic, --validate or --target-wait")
+    return params
+
+
+def _rows_to_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0]), lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def format_results(all_stats, overall_stats, params, fmt):
+    """Render results as 'json' (parameters, overall and per-run) or 'csv' (one row per run)."""
+    runs = [_run_summary(stats) for stats in all_stats]
+    if fmt == 'json':
+        return json.dumps({'parameters': params, 'overall': overall_stats, 'runs': runs}, indent=2) + '\n'
+    return _rows_to_csv(runs)
+
+
+def _write_output(rendered, path):
+    if path:
+        with open(path, 'w') as f:
+            f.write(rendered)
+    else:
+        sys.stdout.write(rendered)
+
+
+@contextlib.contextmanager
+def _text_output(path):
+    """Send what the display functions print to path, or leave it on stdout when path is empty."""
+    if not path:
+        yield
+        return
+    with open(path, 'w') as f, contextlib.redirect_stdout(f):
+        yield
+
+
+def _cache_from_params(params):
+    if not params['cache']:
+        return None
+    return ResultCache(params['cache'], int(params['cache_size'] * 1024 * 1024))
+
+
+def _run_sweep_from_params(params):
+    """CLI sweep mode: one row per scenario (csv/text) or scenarios plus replications (json)."""
+    grid = {'num_tellers': params['tellers'], 'mean_interarrival': params['interarrival'],
+            'mean_service_time': params['service']}
+    if params['paired']:
+        return _run_comparison_from_params(grid, params)
+    writer = ColumnarWriter(params['export_runs']) if params['export_runs'] else None
+    try:
+        run_rows, scenario_rows = run_parameter_sweep(grid, params['horizon'], params['runs'],
+                                                      workers=params['workers'] or None, seed=params['seed'],
+                                                      engine=params['engine'], storage=params['storage'],
+                                                      on_result=writer.write_row if writer is not None else None,
+                                                      variate_block=params['variate_block'], warmup=params['warmup'],
+                                                      cache=_cache_from_params(params))
+    finally:
+        if writer is not None:
+            writer.close()
+    if params['format'] == 'text':
+        with _text_output(params['output']):
+            display_sweep_results(scenario_rows)
+        return 0
+
+    if params['format'] == 'json':
+        run_rows.sort(key=lambda row: (row['num_tellers'], row['mean_interarrival'], row['mean_service_time'], row['run_number']))
+        rendered = json.dumps({'parameters': params, 'scenarios': scenario_rows, 'runs': run_rows}, indent=2) + '\n'
+    else:
+        rendered = _rows_to_csv(scenario_rows)
+    _write_output(rendered, params['output'])
+    return 0
+
+
+def _run_comparison_from_params(grid, params):
+    """CLI --paired mode: paired differences against the first scenario (csv = one row per difference)."""
+    scenario_rows, comparison_rows = compare_scenarios(grid, params['horizon'], params['runs'],
+                                                       workers=params['workers'] or None, seed=params['seed'],
+                                                       engine=params['engine'], storage=params['storage'],
+                                                       variate_block=params['variate_block'], warmup=params['warmup'],
+                                                       cache=_cache_from_params(params))
+    if params['format'] == 'text':
+        with _text_output(params['output']):
+            display_sweep_results(scenario_rows)
+            display_comparison(comparison_rows)
+        return 0
+
+    if params['format'] == 'json':
+        rendered = json.dumps({'parameters': params, 'scenarios': scenario_rows, 'comparisons': comparison_rows},
+                              indent=2) + '\n'
+    else:
+        rendered = _rows_to_csv(comparison_rows)
+    _write_output(rendered, params['output'])
+    return 0
+
+
+def _run_analytic_from_params(params):
+    """CLI --analytic (Erlang-C answer, no simulation) and --validate (engines vs Erlang C) modes."""
+    scenario = (params['tellers'], params['interarrival'], params['service'])
+    if params['analytic']:
+        result = mmc_metrics(*scenario)
+        rows = [result]
+        status = 0
+    else:
+        rows = validate_engines(*scenario, sim_time=params['horizon'], num_runs=params['runs'], seed=params['seed'],
+                                workers=params['workers'] or None)
+        result = {'checks': rows}
+        status = 0 if all(row['passed'] for row in rows) else 1
+
+    if params['format'] == 'text':
+        with _text_output(params['output']):
+            if params['analytic']:
+                display_analytic(result, *scenario)
+            else:
+                display_validation(rows)
+        return status
+
+    if params['format'] == 'json':
+        rendered = json.dumps({'parameters': params, **({'analytic': result} if params['analytic'] else result)},
+                              indent=2) + '\n'
+    else:
+        rendered = _rows_to_csv(rows)
+    _write_output(rendered, params['output'])
+    return status
+
+
+def _run_staffing_from_params(params):
+    """CLI --target-wait mode: one staffing recommendation per interarrival x service slot (tellers are searched)."""
+    grid = {'num_tellers': 1, 'mean_interarrival': params['interarrival'], 'mean_service_time': params['service']}
+    cache = _cache_from_params(params)
+    rows = []
+    for slot in expand_grid(grid):
+        result = optimize_staffing(slot['mean_interarrival'], slot['mean_service_time'], params['horizon'],
+                                   params['target_wait'], initial_runs=params['runs'], max_runs=params['max_runs'],
+                                   seed=params['seed'], engine=params['engine'], storage=params['storage'],
+                                   workers=params['workers'] or None, variate_block=params['variate_block'],
+                                   warmup=params['warmup'], cache=cache)
+        chosen = next(row for row in result['evaluations'] if row['num_tellers'] == result['num_tellers'])
+        rows.append({'mean_interarrival': slot['mean_interarrival'], 'mean_service_time': slot['mean_service_time'],
+                     'erlang_c_tellers': result['erlang_c_tellers'], 'num_tellers': result['num_tellers'],
+                     'mean_avg_waiting_time': chosen['mean_avg_waiting_time'], 'half_width': chosen['half_width'],
+                     'total_runs': result['total_runs']})
+
+    if params['format'] == 'text':
+        with _text_output(params['output']):
+            display_staffing(rows, params['target_wait'])
+        return 0
+
+    if params['format'] == 'json':
+        rendered = json.dumps({'parameters': params, 'slots': rows}, indent=2) + '\n'
+    else:
+        rendered = _rows_to_csv(rows)
+    _write_output(rendered, params['output'])
+    return 0
+
+
+def _run_study_from_params(params):
+    """CLI --study mode: extend (or start) a saved study by --runs replications and report every run so far.
+
+    An existing study keeps its own scenario, seed and engine; a new one
+    takes them from the parameters, with 'stream' storage unless 'sketch'
+    was asked for.
+    """
+    if os.path.exists(params['study']):
+        study = Study.load(params['study'])
+    else:
+        study = Study(params['tellers'], params['interarrival'], params['service'], params['horizon'], params['seed'],
+                      params['engine'], 'sketch' if params['storage'] == 'sketch' else 'stream', params['variate_block'],
+                      params['warmup'])
+    study.extend(params['runs'], workers=params['workers'] or None, cache=_cache_from_params(params))
+    study.save(params['study'])
+    if params['export_runs']:
+        export_runs(study.runs, params['export_runs'])
+
+    scenario = study.scenario
+    control_means = None
+    if params['control_variates']:
+        control_means = known_control_means(scenario['mean_interarrival'], scenario['mean_service_time'],
+                                            scenario['sim_time'], scenario['warmup'])
+    overall_stats = study.overall(control_means)
+    if params['format'] == 'text':
+        with _text_output(params['output']):
+            display_results(study.runs, overall_stats, scenario['num_tellers'])
+        return 0
+
+    study_params = dict(params, tellers=scenario['num_tellers'], interarrival=scenario['mean_interarrival'],
+                        service=scenario['mean_service_time'], horizon=scenario['sim_time'], seed=study.seed,
+                        engine=scenario['engine'], storage=scenario['storage'])
+    _write_output(format_results(study.runs, overall_stats, study_params, params['format']), params['output'])
+    return 0
+
+
+def main(argv=None):
+    """Entry point: interactive prompts with no arguments on a TTY, otherwise headless."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if args.replay:
+        display_replay(replay_trace(args.replay))
+        return 0
+
+    if args.interactive or (not argv and sys.stdin.isatty()):
+        # Step 1: Get parameters
+        num_tellers, mean_interarrival, mean_service_time, sim_time, num_runs = get_simulation_parameters()
+        params = dict(DEFAULT_PARAMETERS, tellers=num_tellers, interarrival=mean_interarrival,
+                      service=mean_service_time, horizon=sim_time, runs=num_runs)
+    else:
+        try:
+            params = resolve_parameters(args)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+
+    if params['target_wait'] is not None:
+        return _run_staffing_from_params(params)
+    if any(isinstance(params[key], (list, tuple)) for key in ('tellers', 'interarrival', 'service')):
+        return _run_sweep_from_params(params)
+    if params['analytic'] or params['validate']:
+        try:
+            return _run_analytic_from_params(params)
+        except ValueError as e:  # unstable queue
+            parser.error(str(e))
+
+    if params['study']:
+        return _run_study_from_params(params)
+
+    text_output = params['format'] == 'text' and not params['output']
+    sequential = params['precision'] is not None or params['relative_precision'] is not None
 
     # Step 2: Run multiple simulations
-    print(f"\n=== Bank Queue Simulation - {num_runs} Runs ===")
+    if text_output and params['batch_means']:
+        print(f"\n=== Bank Queue Simulation - 1 Run of {params['horizon']:g} Minutes (batch means) ===")
+    elif text_output:
+        runs = f"{params['runs']}-{params['max_runs']}" if sequential else params['runs']
+        print(f"\n=== Bank Queue Simulation - {runs} Runs ===")
     
+    tracer = recorder = None
+    cache = _cache_from_params(params)
+    if params['trace']:
+        tracer = EventTracer(FileSink(params['trace']), params['trace_level'], params['trace_sample'])
+    if params['record']:
+        recorder = BinaryTraceRecorder(params['record'])
+    elif params['export_customers']:
+        recorder = ColumnarCustomerRecorder(params['export_customers'])
+
     # Run all simulations
-    all_stats = run_multiple_simulations(num_tellers, mean_interarrival, mean_service_time, sim_time, num_runs)
-    
-    # Calculate overall statistics
-    overall_stats = calculate_overall_statistics(all_stats)
+    if params['batch_means']:
+        all_stats, overall_stats = run_batch_means(params['tellers'], params['interarrival'], params['service'],
+                                                   params['horizon'], seed=params['seed'], engine=params['engine'],
+                                                   warmup=params['warmup'], variate_block=params['variate_block'],
+                                                   tracer=tracer, recorder=recorder)
+    elif sequential:
+        all_stats, overall_stats = run_until_precision(params['tellers'], params['interarrival'], params['service'],
+                                                       params['horizon'], params['precision'], params['relative_precision'],
+                                                       min_runs=params['runs'], max_runs=params['max_runs'],
+                                                       workers=params['workers'] or None, seed=params['seed'],
+                                                       engine=params['engine'], storage=params['storage'],
+                                                       variate_block=params['variate_block'],
+                                                       tracer=tracer, recorder=recorder, warmup=params['warmup'],
+                                                       cache=cache)
+    else:
+        all_stats = run_multiple_simulations(params['tellers'], params['interarrival'], params['service'],
+                                             params['horizon'], params['runs'],
+                                             workers=params['workers'] or None, seed=params['seed'],
+                                             engine=params['engine'], storage=params['storage'],
+                                             verbose=text_output, variate_block=params['variate_block'],
+                                             tracer=tracer, recorder=recorder, warmup=params['warmup'],
+                                             antithetic=params['antithetic'], cache=cache,
+                                             store=MappedResultStore(params['store']) if params['store'] else None)
+
+        # Calculate overall statistics
+        control_means = None
+        if params['control_variates']:
+            control_means = known_control_means(params['interarrival'], params['service'], params['horizon'],
+                                                params['warmup'])
+        overall_stats = calculate_overall_statistics(all_stats, control_means)
+    if recorder is not None:
+        recorder.close()
+    if params['export_runs']:
+        export_runs(all_stats, params['export_runs'])
     
     # Display results
-    display_results(all_stats, overall_stats, num_tellers)
-    
-    print(f"\n{'='*60}")
-    print("Simulation Complete!")
-    print(f"{'='*60}")
\ No newline at end of file
+    if params['format'] == 'text':
+        with _text_output(params['output']):
+            display_results(all_stats, overall_stats, params['tellers'])
+        if params['output']:
+            return 0
+        print(f"\n{'='*60}")
+        print("Simulation Complete!")
+        print(f"{'='*60}")
+        return 0
+
+    _write_output(format_results(all_stats, overall_stats, params, params['format']), params['output'])
+    return 0
+
+
+# === Main Program ===
+if __name__ == "__main__":
+    sys.exit(main())
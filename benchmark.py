@@ -0,0 +1,205 @@
+# ==============================
+# Bank Queue Simulation - Benchmark Suite
+# ==============================
+#
+# Measures how fast each simulation engine runs across utilization levels,
+# teller counts, horizons and run counts, and compares against saved baselines.
+#
+#   python benchmark.py                          # quick suite, all engines
+#   python benchmark.py --suite full --save baseline.json
+#   python benchmark.py --compare baseline.json  # flags regressions
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import bank_queue_sim
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+# Customer events per served customer: arrival, service start, departure
+EVENTS_PER_CUSTOMER = 3
+
+SUITES = {
+    'quick': {
+        'utilization': [0.5, 0.9],
+        'tellers': [1, 4],
+        'horizon': [480, 10_000],
+        'runs': [1, 10]
+    },
+    'full': {
+        'utilization': [0.3, 0.7, 0.9, 0.98],
+        'tellers': [1, 3, 10],
+        'horizon': [480, 10_000, 100_000, 1_000_000],
+        'runs': [1, 10, 100]
+    }
+}
+
+
+# === Benchmark Cases ===
+def build_cases(suite, engines):
+    """One case per engine x utilization x tellers x horizon x runs, skipping very long combinations."""
+    grid = SUITES[suite]
+    cases = []
+    for engine, rho, tellers, horizon, runs in itertools.product(engines, grid['utilization'], grid['tellers'],
+                                                                 grid['horizon'], grid['runs']):
+        if horizon * runs > 1_000_000:
+            continue  # keep every case to at most ~1e6 simulated minutes
+        cases.append({
+            'engine': engine,
+            'utilization': rho,
+            'tellers': tellers,
+            'horizon': horizon,
+            'runs': runs,
+            # One arrival per minute; service time sets the utilization
+            'mean_interarrival': 1.0,
+            'mean_service_time': rho * tellers
+        })
+    return cases
+
+
+def case_key(case):
+    return f"{case['engine']}/rho={case['utilization']}/c={case['tellers']}/T={case['horizon']:g}/n={case['runs']}"
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_case(case, repeat=3, seed=12345, min_time=0.2):
+    """Time one case (best of repeat) in the current process.
+
+    Like timeit's autorange, each repetition loops the case 1, 2, 5, 10, ...
+    times until it takes at least min_time seconds, so cases lasting a few
+    milliseconds are not dominated by timer and scheduling noise.
+    """
+    def simulate():
+        return bank_queue_sim.run_multiple_simulations(case['tellers'], case['mean_interarrival'],
+                                                       case['mean_service_time'], case['horizon'], case['runs'],
+                                                       seed=seed, engine=case['engine'], storage='stream',
+                                                       verbose=False)
+
+    def time_loops(loops):
+        start = time.perf_counter()
+        for _ in range(loops):
+            simulate()
+        return time.perf_counter() - start
+
+    customers = sum(stats['customers_served'] for stats in simulate())  # also warms up
+    loops = 1
+    for multiplier in itertools.cycle((2, 2.5, 2)):
+        elapsed = time_loops(loops)
+        if elapsed >= min_time:
+            break
+        loops = int(loops * multiplier)
+    timings = [elapsed / loops] + [time_loops(loops) / loops for _ in range(repeat - 1)]
+
+    wall = min(timings)
+    return dict(case,
+                wall_time=wall,
+                loops=loops,
+                customers=customers,
+                customers_per_sec=customers / wall if wall > 0 else 0,
+                ns_per_event=wall * 1e9 / (customers * EVENTS_PER_CUSTOMER) if customers else None,
+                peak_rss_mb=_peak_rss_mb())
+
+
+def measure_case(case, repeat=3, min_time=0.2):
+    """Run a case in a fresh process so peak RSS belongs to that case alone."""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(run_case, case, repeat, min_time=min_time).result()
+
+
+# === Baselines and Reports ===
+def save_baseline(results, path):
+    baseline = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'results': {case_key(result): result for result in results}
+    }
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2)
+
+
+def compare_to_baseline(results, path, threshold=0.10):
+    """Return (report_lines, regressions) comparing customers/sec with a saved baseline."""
+    with open(path) as f:
+        baseline = json.load(f)['results']
+
+    lines = [f"{'Case':<44} {'Baseline':>12} {'Current':>12} {'Change':>8}"]
+    regressions = []
+    for result in results:
+        key = case_key(result)
+        if key not in baseline:
+            lines.append(f"{key:<44} {'-':>12} {result['customers_per_sec']:12,.0f} {'new':>8}")
+            continue
+        before = baseline[key]['customers_per_sec']
+        change = result['customers_per_sec'] / before - 1 if before else 0
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressions.append(key)
+        lines.append(f"{key:<44} {before:12,.0f} {result['customers_per_sec']:12,.0f} {change:+8.1%}{flag}")
+    return lines, regressions
+
+
+def display_results(results):
+    print(f"{'Case':<44} {'Wall (s)':>9} {'Customers':>11} {'Cust/sec':>12} {'ns/event':>9} {'Peak RSS':>9}")
+    for result in results:
+        ns = f"{result['ns_per_event']:9.0f}" if result['ns_per_event'] is not None else f"{'-':>9}"
+        rss = f"{result['peak_rss_mb']:7.1f}MB" if result['peak_rss_mb'] is not None else f"{'-':>9}"
+        print(f"{case_key(result):<44} {result['wall_time']:9.3f} {result['customers']:11,d} "
+              f"{result['customers_per_sec']:12,.0f} {ns} {rss}")
+
+
+# === Main Program ===
+def main(argv=None):
+    available = [engine for engine in bank_queue_sim.ENGINES if engine != 'numpy' or bank_queue_sim.np is not None]
+    parser = argparse.ArgumentParser(description="Benchmark the bank queue simulation engines.")
+    parser.add_argument('--suite', choices=sorted(SUITES), default='quick')
+    parser.add_argument('--engines', nargs='+', choices=available, default=available)
+    parser.add_argument('--repeat', type=int, default=3, help="timed repetitions per case (best is kept)")
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help="minimum seconds per timed repetition; short cases are looped (default 0.2)")
+    parser.add_argument('--save', help="write results as a baseline JSON file")
+    parser.add_argument('--compare', help="compare against a baseline JSON file")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="slowdown in customers/sec that counts as a regression (default 0.10)")
+    args = parser.parse_args(argv)
+
+    results = []
+    for case in build_cases(args.suite, args.engines):
+        results.append(measure_case(case, args.repeat, args.min_time))
+        print(f"  done {case_key(case)}", file=sys.stderr)
+
+    display_results(results)
+    if args.save:
+        save_baseline(results, args.save)
+        print(f"\nBaseline saved to {args.save}")
+    if args.compare:
+        lines, regressions = compare_to_baseline(results, args.compare, args.threshold)
+        print(f"\n--- Comparison with {args.compare} ---")
+        print("\n".join(lines))
+        if regressions:
+            print(f"\n{len(regressions)} case(s) regressed by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# ==============================
+# Bank Queue Simulation - Erlang-C (analytic M/M/c)
+# ==============================
+#
+# Closed-form steady-state results for the model the simulation runs:
+# Poisson arrivals, exponential service times and c identical tellers
+# serving one FCFS queue.
+#
+#   from erlang_c import mmc_metrics
+#   mmc_metrics(3, mean_interarrival=1.0, mean_service_time=2.0)
+
+import math
+
+
+def erlang_c(num_tellers, offered_load):
+    """Probability that an arriving customer has to wait (Erlang C formula).
+
+    offered_load is arrival rate x mean service time, in Erlangs. Uses the
+    Erlang B recursion, which stays stable for large teller counts.
+    """
+    if offered_load >= num_tellers:
+        return 1.0
+    blocking = 1.0
+    for k in range(1, num_tellers + 1):
+        blocking = offered_load * blocking / (k + offered_load * blocking)
+    return num_tellers * blocking / (num_tellers - offered_load * (1 - blocking))
+
+
+def waiting_time_percentile(q, num_tellers, mean_interarrival, mean_service_time):
+    """q-quantile (0 <= q < 1) of the steady-state waiting time.
+
+    The wait is 0 with probability 1 - C and otherwise exponential with rate
+    c * mu - lambda, so P(W > t) = C * exp(-(c * mu - lambda) * t).
+    """
+    arrival_rate, service_rate = 1.0 / mean_interarrival, 1.0 / mean_service_time
+    _check_stable(num_tellers, arrival_rate, service_rate)
+    prob_wait = erlang_c(num_tellers, arrival_rate / service_rate)
+    if 1 - q >= prob_wait:
+        return 0.0
+    return math.log(prob_wait / (1 - q)) / (num_tellers * service_rate - arrival_rate)
+
+
+def mmc_metrics(num_tellers, mean_interarrival, mean_service_time, percentiles=(50, 90, 95, 99)):
+    """Steady-state M/M/c statistics named like the simulation's output.
+
+    Returns utilization, prob_wait, avg_waiting_time (Wq), avg_time_in_system
+    (W), avg_queue_length (Lq), avg_in_system (L) and waiting_time_pXX for the
+    requested percentiles. Raises ValueError when the queue is unstable.
+    """
+    arrival_rate, service_rate = 1.0 / mean_interarrival, 1.0 / mean_service_time
+    _check_stable(num_tellers, arrival_rate, service_rate)
+    offered_load = arrival_rate / service_rate
+    prob_wait = erlang_c(num_tellers, offered_load)
+    avg_wait = prob_wait / (num_tellers * service_rate - arrival_rate)
+
+    metrics = {
+        'utilization': offered_load / num_tellers,
+        'prob_wait': prob_wait,
+        'avg_waiting_time': avg_wait,
+        'avg_time_in_system': avg_wait + mean_service_time,
+        'avg_queue_length': arrival_rate * avg_wait,  # Little's law
+        'avg_in_system': arrival_rate * avg_wait + offered_load
+    }
+    for p in percentiles:
+        metrics[f'waiting_time_p{p}'] = waiting_time_percentile(p / 100, num_tellers, mean_interarrival, mean_service_time)
+    return metrics
+
+
+def _check_stable(num_tellers, arrival_rate, service_rate):
+    if num_tellers < 1 or arrival_rate <= 0 or service_rate <= 0:
+        raise ValueError("tellers, arrival rate and service rate must be positive")
+    if arrival_rate >= num_tellers * service_rate:
+        raise ValueError(f"Unstable queue: utilization {arrival_rate / (num_tellers * service_rate):.3f} >= 1, "
+                         "no steady state exists")
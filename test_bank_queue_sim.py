@@ -0,0 +1,73 @@
+# ==============================
+# Bank Queue Simulation - Engine Equivalence Tests
+# ==============================
+#
+# The simpy, numpy and kernel engines draw the same variates from the same
+# seed, so they must agree run for run; so must serial and parallel runs,
+# a replayed trace and a study extended in steps.
+#
+#   python -m pytest -q
+
+import pytest
+
+import bank_queue_sim
+from bank_queue_sim import (VARIATE_BLOCK_SIZE, BinaryTraceRecorder, EventTracer, NullSink, Study, replay_trace,
+                            run_multiple_simulations, run_single_simulation)
+
+ENGINES = [engine for engine in bank_queue_sim.ENGINES if engine != 'numpy' or bank_queue_sim.np is not None]
+RUN_METRICS = ('customers_served', 'avg_waiting_time', 'max_waiting_time', 'avg_service_time', 'avg_queue_length',
+               'max_queue_length', 'avg_in_system', 'utilization', 'customers_arrived')
+# (tellers, interarrival, service): no waiting at all, and a queue still growing at the horizon
+SCENARIOS = [(10, 1.0, 2.0), (2, 1.0, 2.2)]
+
+
+def _metrics(stats, keys=RUN_METRICS):
+    return {key: stats[key] for key in keys}
+
+
+@pytest.mark.parametrize('scenario', SCENARIOS)
+@pytest.mark.parametrize('warmup', [None, 60.0])
+def test_engines_agree_run_for_run(scenario, warmup):
+    runs = [run_single_simulation(*scenario, 480, seed=5, engine=engine, variate_block=VARIATE_BLOCK_SIZE,
+                                  warmup=warmup) for engine in ENGINES]
+    for stats in runs[1:]:
+        assert _metrics(stats) == pytest.approx(_metrics(runs[0]), rel=1e-9)
+
+
+@pytest.mark.skipif(bank_queue_sim.np is None, reason="the numpy engine needs NumPy")
+def test_traced_numpy_runs_match_untraced():
+    # Event traces send engine='numpy' through simpy, which must reuse the numpy engine's streams
+    plain = run_single_simulation(3, 1.0, 2.0, 480, seed=5, engine='numpy')
+    traced = run_single_simulation(3, 1.0, 2.0, 480, seed=5, engine='numpy', tracer=EventTracer(NullSink()))
+    assert _metrics(traced) == pytest.approx(_metrics(plain), rel=1e-9)
+
+
+def test_serial_and_parallel_runs_match():
+    serial = run_multiple_simulations(3, 1.0, 2.0, 480, 6, workers=1, seed=11, verbose=False)
+    parallel = run_multiple_simulations(3, 1.0, 2.0, 480, 6, workers=2, seed=11, verbose=False)
+    assert [_metrics(stats, RUN_METRICS + ('seed',)) for stats in parallel] == \
+        [_metrics(stats, RUN_METRICS + ('seed',)) for stats in serial]
+
+
+@pytest.mark.skipif(bank_queue_sim.np is None, reason="replay needs NumPy")
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('scenario', SCENARIOS)
+def test_replay_matches_run(tmp_path, engine, scenario):
+    recorder = BinaryTraceRecorder(str(tmp_path / 'trace.bqt'))
+    stats = run_single_simulation(*scenario, 480, seed=1, engine=engine, variate_block=VARIATE_BLOCK_SIZE,
+                                  recorder=recorder)
+    recorder.close()
+    [replayed] = replay_trace(str(tmp_path / 'trace.bqt'))
+    keys = ('customers_served', 'customers_arrived', 'avg_waiting_time', 'max_waiting_time', 'avg_queue_length',
+            'max_queue_length', 'utilization')
+    assert _metrics(replayed, keys) == pytest.approx(_metrics(stats, keys), rel=1e-9)
+
+
+def test_extended_study_matches_single_study():
+    stepwise = Study(3, 1.0, 2.0, 480, seed=7, engine='kernel')
+    stepwise.extend(10)
+    stepwise.extend(30)
+    single = Study(3, 1.0, 2.0, 480, seed=7, engine='kernel')
+    single.extend(40)
+    assert stepwise.runs == single.runs
+    assert stepwise.overall() == pytest.approx(single.overall(), rel=1e-12)